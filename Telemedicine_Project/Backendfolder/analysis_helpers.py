@@ -0,0 +1,70 @@
+import re
+
+import plotly.graph_objects as go
+
+
+def analyze_duration_context(text):
+    text_lower = text.lower()
+    duration_indicators = {
+        'days': r'(\d+)\s*days?',
+        'weeks': r'(\d+)\s*weeks?',
+        'months': r'(\d+)\s*months?'
+    }
+
+    additional_context = []
+
+    for period, pattern in duration_indicators.items():
+        matches = re.findall(pattern, text_lower)
+        if matches:
+            duration = int(matches[0])
+            if period == 'days' and duration > 7:
+                additional_context.append(f"⚠️ Symptoms persisting for {duration} days may require medical evaluation.")
+            elif period == 'weeks' and duration > 1:
+                additional_context.append(f"⚠️ Symptoms persisting for {duration} weeks require medical attention.")
+            elif period == 'months':
+                additional_context.append(f"⚠️ Chronic condition lasting {duration} months - medical evaluation recommended.")
+
+    symptoms_of_concern = {
+        'fever': "Monitor temperature and stay hydrated",
+        'chest pain': "Seek immediate medical attention for chest pain",
+        'difficulty breathing': "Monitor oxygen levels and breathing pattern",
+        'shortness of breath': "Monitor oxygen levels and breathing pattern",
+        'cold': "Monitor symptoms and seek medical attention if persisting beyond a week",
+        'cough': "Monitor cough progression and any changes in character",
+        'headache': "Monitor intensity and frequency of headaches",
+        'pain': "Track pain levels and any changes in intensity or location"
+    }
+
+    for symptom, advice in symptoms_of_concern.items():
+        if symptom in text_lower:
+            additional_context.append(f"🔔 {advice}")
+
+    return additional_context
+
+def create_gauge_chart(value, title, severity):
+    colors = {'High': 'red', 'Moderate': 'orange', 'Low': 'green'}
+
+    fig = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=value * 100,
+        domain={'x': [0, 1], 'y': [0, 1]},
+        title={'text': title, 'font': {'size': 24}},
+        gauge={
+            'axis': {'range': [0, 100], 'tickwidth': 1},
+            'bar': {'color': colors.get(severity, 'blue')},
+            'bgcolor': "white",
+            'steps': [
+                {'range': [0, 33], 'color': "rgba(255, 0, 0, 0.1)"},
+                {'range': [33, 66], 'color': "rgba(255, 165, 0, 0.1)"},
+                {'range': [66, 100], 'color': "rgba(0, 255, 0, 0.1)"}
+            ],
+            'threshold': {
+                'line': {'color': colors.get(severity, 'blue'), 'width': 4},
+                'thickness': 0.75,
+                'value': value * 100
+            }
+        }
+    ))
+
+    fig.update_layout(height=250, font={'size': 16}, margin=dict(l=20, r=20, t=40, b=20))
+    return fig
@@ -15,7 +15,15 @@ from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 import os.path
 import pickle
+import tempfile
 from datetime import datetime, timedelta
+from chunking import DEFAULT_BATCH_SIZE
+from bulk_analysis import BulkSummary, score_chunk, stream_bulk_analysis
+from parallel_scoring import get_parallel_scorer
+from analysis_helpers import analyze_duration_context, create_gauge_chart
+from instrumentation import stage, enable_metrics
+from model_registry import get_load_stats
+from model_watcher import get_model_watcher
 
 # Set page configuration
 st.set_page_config(
@@ -36,6 +44,26 @@ GOOGLE_CX = "your API key"
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel('gemini-1.5-flash')
 
+# Directory of severity model bundles. The app serves its current model
+# (the `current` pointer, else the newest bundle) and swaps in new ones
+# without a restart; see model_watcher.py
+MODELS_DIR = os.environ.get('MEDISCAN_MODELS_DIR', '/content/models')
+
+# Uploads larger than this default to streaming bulk analysis
+STREAMING_THRESHOLD_BYTES = 20 * 1024 * 1024
+# Rows shown in the results table when streaming
+RESULTS_PREVIEW_ROWS = 1000
+# st.download_button holds the whole file in Streamlit's in-memory media
+# store, so streamed results larger than this are kept on disk in
+# BULK_RESULTS_DIR instead of being offered as a download
+DOWNLOAD_MAX_BYTES = 50 * 1024 * 1024
+BULK_RESULTS_DIR = os.environ.get('MEDISCAN_RESULTS_DIR', tempfile.gettempdir())
+# Default worker processes for bulk scoring (1 scores in the app process)
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', 1))
+# Per-stage timing of classification requests, off unless MEDISCAN_METRICS=1
+METRICS_ENABLED = os.environ.get('MEDISCAN_METRICS') == '1'
+metrics = enable_metrics() if METRICS_ENABLED else None
+
 # Google Calendar API setup
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
@@ -88,73 +116,6 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# Helper Functions
-def analyze_duration_context(text):
-    text_lower = text.lower()
-    duration_indicators = {
-        'days': r'(\d+)\s*days?',
-        'weeks': r'(\d+)\s*weeks?',
-        'months': r'(\d+)\s*months?'
-    }
-
-    additional_context = []
-
-    for period, pattern in duration_indicators.items():
-        matches = re.findall(pattern, text_lower)
-        if matches:
-            duration = int(matches[0])
-            if period == 'days' and duration > 7:
-                additional_context.append(f"⚠️ Symptoms persisting for {duration} days may require medical evaluation.")
-            elif period == 'weeks' and duration > 1:
-                additional_context.append(f"⚠️ Symptoms persisting for {duration} weeks require medical attention.")
-            elif period == 'months':
-                additional_context.append(f"⚠️ Chronic condition lasting {duration} months - medical evaluation recommended.")
-
-    symptoms_of_concern = {
-        'fever': "Monitor temperature and stay hydrated",
-        'chest pain': "Seek immediate medical attention for chest pain",
-        'difficulty breathing': "Monitor oxygen levels and breathing pattern",
-        'shortness of breath': "Monitor oxygen levels and breathing pattern",
-        'cold': "Monitor symptoms and seek medical attention if persisting beyond a week",
-        'cough': "Monitor cough progression and any changes in character",
-        'headache': "Monitor intensity and frequency of headaches",
-        'pain': "Track pain levels and any changes in intensity or location"
-    }
-
-    for symptom, advice in symptoms_of_concern.items():
-        if symptom in text_lower:
-            additional_context.append(f"🔔 {advice}")
-
-    return additional_context
-
-def create_gauge_chart(value, title, severity):
-    colors = {'High': 'red', 'Moderate': 'orange', 'Low': 'green'}
-
-    fig = go.Figure(go.Indicator(
-        mode="gauge+number",
-        value=value * 100,
-        domain={'x': [0, 1], 'y': [0, 1]},
-        title={'text': title, 'font': {'size': 24}},
-        gauge={
-            'axis': {'range': [0, 100], 'tickwidth': 1},
-            'bar': {'color': colors.get(severity, 'blue')},
-            'bgcolor': "white",
-            'steps': [
-                {'range': [0, 33], 'color': "rgba(255, 0, 0, 0.1)"},
-                {'range': [33, 66], 'color': "rgba(255, 165, 0, 0.1)"},
-                {'range': [66, 100], 'color': "rgba(0, 255, 0, 0.1)"}
-            ],
-            'threshold': {
-                'line': {'color': colors.get(severity, 'blue'), 'width': 4},
-                'thickness': 0.75,
-                'value': value * 100
-            }
-        }
-    ))
-
-    fig.update_layout(height=250, font={'size': 16}, margin=dict(l=20, r=20, t=40, b=20))
-    return fig
-
 # Calendar Functions
 from google.oauth2 import service_account
 
@@ -298,33 +259,6 @@ def display_appointments(service):
     ).execute()
     return events_result.get('items', [])
 
-# Medical Text Classifier
-class MedicalTextClassifier:
-    def __init__(self, model_dir):
-        self.model = joblib.load(f'{model_dir}/model.joblib')
-        self.tfidf = joblib.load(f'{model_dir}/tfidf_vectorizer.joblib')
-        self.label_encoder = joblib.load(f'{model_dir}/label_encoder.joblib')
-
-    def preprocess_text(self, text):
-        if not isinstance(text, str):
-            return ''
-        text = text.lower()
-        text = re.sub(r'[^a-zA-Z\s.,!?]', ' ', text)
-        return ' '.join(text.split())
-
-    def predict_single(self, text):
-        processed_text = self.preprocess_text(text)
-        text_tfidf = self.tfidf.transform([processed_text])
-        prediction_encoded = self.model.predict(text_tfidf)
-        prediction_proba = self.model.predict_proba(text_tfidf)
-        prediction = self.label_encoder.inverse_transform(prediction_encoded)
-        class_probabilities = dict(zip(self.label_encoder.classes_, prediction_proba[0]))
-        return {
-            'prediction': prediction[0],
-            'confidence_scores': class_probabilities,
-            'processed_text': processed_text
-        }
-
 def get_medicine_images(medicine_name):
     try:
         search_url = "https://www.googleapis.com/customsearch/v1"
@@ -482,8 +416,19 @@ def main():
         st.title("MediScan - Medical Text Analysis")
 
         try:
-            classifier = MedicalTextClassifier('/content/models/medical_classifier_20250126_185815')
+            # One model for the whole run, even if a new one is swapped in meanwhile
+            classifier = get_model_watcher(MODELS_DIR).current()
             st.success("✅ AI Model Ready", icon="✨")
+            load_stats = get_load_stats(classifier.model_dir, classifier.engine)
+            # No stats when this model was replaced since the run started
+            if load_stats is not None:
+                st.caption(f"Model {classifier.model_version} ({classifier.engine} engine) loaded in "
+                           f"{load_stats['load_seconds']:.2f}s · "
+                           f"{load_stats['resident_bytes'] / 2**20:.1f} MB resident · "
+                           f"{load_stats['mapped_bytes'] / 2**20:.1f} MB shared")
+            if metrics is not None:
+                with st.expander("⏱️ Stage timings"):
+                    st.code(metrics.exposition(), language='text')
 
             tab1, tab2 = st.tabs(["📝 Single Case Analysis", "📊 Bulk Case Analysis"])
 
@@ -520,12 +465,14 @@ def main():
 
                 if analyze_button and text_input:
                     with st.spinner("🔄 Analyzing medical case..."):
-                        result = classifier.predict_single(text_input)
+                        with stage('classify'):
+                            result = classifier.predict_single(text_input)
 
                     st.markdown("### 📋 Analysis Results")
                     severity = result['prediction']
                     confidence = max(result['confidence_scores'].values())
-                    context_notes = analyze_duration_context(text_input)
+                    with stage('duration_context'):
+                        context_notes = analyze_duration_context(text_input)
 
                     severity_class = {
                         'High': 'high-severity',
@@ -549,9 +496,10 @@ def main():
                         st.warning("While current symptoms suggest low severity, the duration of symptoms indicates that medical consultation may be advisable.")
 
                     st.markdown("### 📊 Detailed Analysis")
-                    for class_name, probability in result['confidence_scores'].items():
-                        fig = create_gauge_chart(probability, f"{class_name} Severity Level", class_name)
-                        st.plotly_chart(fig, use_container_width=True)
+                    with stage('plotly_render'):
+                        for class_name, probability in result['confidence_scores'].items():
+                            fig = create_gauge_chart(probability, f"{class_name} Severity Level", class_name)
+                            st.plotly_chart(fig, use_container_width=True)
 
             with tab2:
                 st.markdown("### 📁 Bulk Case Analysis")
@@ -565,13 +513,24 @@ def main():
 
                 uploaded_file = st.file_uploader("", type=['csv'])
 
-                if uploaded_file is not None:
+                if uploaded_file is not None and uploaded_file.size == 0:
+                    st.warning("The uploaded file is empty")
+                elif uploaded_file is not None:
                     try:
-                        df = pd.read_csv(uploaded_file)
-                        text_column = df.columns[0]
+                        stream_mode = st.checkbox(
+                            "⚡ Streaming mode (large files, bounded memory)",
+                            value=uploaded_file.size > STREAMING_THRESHOLD_BYTES
+                        )
+
+                        max_workers = os.cpu_count() or 1
+                        n_workers = st.slider("🧮 Worker processes", 1, max_workers,
+                                              value=min(BULK_WORKERS, max_workers)) if max_workers > 1 else 1
+
+                        preview_df = pd.read_csv(uploaded_file, nrows=3)
+                        uploaded_file.seek(0)
 
                         st.markdown("### 📋 Case Preview")
-                        st.dataframe(df.head(3), use_container_width=True)
+                        st.dataframe(preview_df, use_container_width=True)
 
                         col1, col2, col3 = st.columns([1, 2, 1])
                         with col2:
@@ -579,20 +538,43 @@ def main():
                                 progress_bar = st.progress(0)
                                 status_text = st.empty()
 
-                                results = []
-                                for i, text in enumerate(df[text_column]):
-                                    result = classifier.predict_single(text)
-                                    results.append(result)
-                                    progress = (i + 1) / len(df)
-                                    progress_bar.progress(progress)
-                                    status_text.text(f"Analyzing case {i+1} of {len(df)}")
+                                # Shard chunks across a process pool when more than one worker is chosen;
+                                # a model swapped out since this run started scores in-process
+                                scorer = (get_parallel_scorer(classifier.model_dir, n_workers, fallback=classifier)
+                                          if n_workers > 1 else classifier)
+                                chunk_size = DEFAULT_BATCH_SIZE * n_workers
+
+                                if stream_mode:
+                                    def report_progress(analyzed, summary, chunk):
+                                        progress_bar.progress(min(uploaded_file.tell() / max(uploaded_file.size, 1), 1.0))
+                                        status_text.text(f"Analyzed {analyzed} cases")
+
+                                    # Scored rows go to disk; only the preview is read back
+                                    os.makedirs(BULK_RESULTS_DIR, exist_ok=True)
+                                    with tempfile.NamedTemporaryFile(prefix='medical_case_analysis_', suffix='.csv',
+                                                                     dir=BULK_RESULTS_DIR, delete=False) as output:
+                                        _, summary = stream_bulk_analysis(uploaded_file, scorer, chunk_size,
+                                                                          on_chunk=report_progress, output=output)
+                                    results_path = output.name
+                                    results_df = (pd.read_csv(results_path, nrows=RESULTS_PREVIEW_ROWS)
+                                                  if os.path.getsize(results_path) else pd.DataFrame())
+                                else:
+                                    df = pd.read_csv(uploaded_file)
+                                    text_column = df.columns[0]
+                                    summary = BulkSummary()
+                                    scored_chunks = []
+                                    for start in range(0, len(df), chunk_size):
+                                        chunk = score_chunk(scorer, df.iloc[start:start + chunk_size].copy(), text_column)
+                                        summary.update(chunk['Severity_Level'].tolist(), chunk['Confidence_Score'].to_numpy())
+                                        scored_chunks.append(chunk)
+                                        progress_bar.progress(summary.total_cases / len(df))
+                                        status_text.text(f"Analyzing case {summary.total_cases} of {len(df)}")
+                                    results_df = pd.concat(scored_chunks) if scored_chunks else df
+                                    csv = results_df.to_csv(index=False)
 
                                 progress_bar.empty()
                                 status_text.empty()
 
-                                df['Severity_Level'] = [r['prediction'] for r in results]
-                                df['Confidence_Score'] = [max(r['confidence_scores'].values()) for r in results]
-
                                 st.markdown("### 📊 Analysis Summary")
                                 col1, col2, col3 = st.columns(3)
 
@@ -602,42 +584,61 @@ def main():
                                             <h3>Total Cases</h3>
                                             <h2>{}</h2>
                                         </div>
-                                    """.format(len(df)), unsafe_allow_html=True)
+                                    """.format(summary.total_cases), unsafe_allow_html=True)
 
                                 with col2:
-                                    high_severity = (df['Severity_Level'] == 'High').sum()
                                     st.markdown("""
                                         <div class='metric-card'>
                                             <h3>High Severity Cases</h3>
                                             <h2 style='color: red;'>{}</h2>
                                         </div>
-                                    """.format(high_severity), unsafe_allow_html=True)
+                                    """.format(summary.high_severity), unsafe_allow_html=True)
 
                                 with col3:
-                                    avg_confidence = df['Confidence_Score'].mean()
                                     st.markdown("""
                                         <div class='metric-card'>
                                             <h3>Avg. Confidence</h3>
                                             <h2>{:.1%}</h2>
                                         </div>
-                                    """.format(avg_confidence), unsafe_allow_html=True)
+                                    """.format(summary.mean_confidence), unsafe_allow_html=True)
 
                                 st.markdown("### 📋 Detailed Results")
-                                st.dataframe(df, use_container_width=True)
-
-                                csv = df.to_csv(index=False)
-                                st.download_button(
-                                    label="📥 Download Complete Analysis",
-                                    data=csv,
-                                    file_name="medical_case_analysis.csv",
-                                    mime="text/csv",
-                                    use_container_width=True
-                                )
+                                st.dataframe(results_df, use_container_width=True)
+                                results_on_disk = stream_mode and os.path.getsize(results_path) > DOWNLOAD_MAX_BYTES
+                                if stream_mode and summary.total_cases > RESULTS_PREVIEW_ROWS:
+                                    st.caption(f"Showing the first {RESULTS_PREVIEW_ROWS} of {summary.total_cases} cases. "
+                                               + ("The complete analysis is saved below." if results_on_disk
+                                                  else "Download the complete analysis below."))
+
+                                if results_on_disk:
+                                    # Too large for Streamlit's in-memory download; the file stays on disk
+                                    st.info(f"📁 Complete analysis saved to {results_path}")
+                                elif stream_mode:
+                                    # Streamlit reads the file into its in-memory media store to serve
+                                    # the download, which DOWNLOAD_MAX_BYTES bounds
+                                    with open(results_path, 'rb') as results_file:
+                                        st.download_button(
+                                            label="📥 Download Complete Analysis",
+                                            data=results_file,
+                                            file_name="medical_case_analysis.csv",
+                                            mime="text/csv",
+                                            use_container_width=True
+                                        )
+                                    os.remove(results_path)
+                                else:
+                                    st.download_button(
+                                        label="📥 Download Complete Analysis",
+                                        data=csv,
+                                        file_name="medical_case_analysis.csv",
+                                        mime="text/csv",
+                                        use_container_width=True
+                                    )
 
                                 st.markdown("### 📊 Severity Distribution")
+                                severity_counts = summary.severity_counts.most_common()
                                 fig = go.Figure(data=[go.Pie(
-                                    labels=df['Severity_Level'].value_counts().index,
-                                    values=df['Severity_Level'].value_counts().values,
+                                    labels=[severity for severity, _ in severity_counts],
+                                    values=[count for _, count in severity_counts],
                                     hole=.3,
                                     marker_colors=['#ff4444', '#ffa500', '#44ff44']
                                 )])
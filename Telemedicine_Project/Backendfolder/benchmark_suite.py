@@ -0,0 +1,257 @@
+"""Offline benchmark suite for the text-analysis hot paths
+
+Trains a small model on Dataset/medical_cases.csv (cached under
+benchmark_results/model) and times the serving and training hot paths at
+several input sizes. For each benchmark it reports throughput,
+p50/p95/p99 latency per call and peak traced memory. Results are written
+as JSON so runs from different commits can be compared:
+
+    python benchmark_suite.py
+    python benchmark_suite.py --compare benchmark_results/<older run>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import LabelEncoder
+
+from analysis_helpers import analyze_duration_context, create_gauge_chart
+from lexicon_sentiment import LexiconSentiment, textblob_polarity
+from medical_classifier import MedicalTextClassifier
+from onnx_backend import export_model_dir
+from severity_labeler import default_labeler
+from text_normalizer import normalize_series, normalize_text, reference_preprocess_text
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_PATH = os.path.join(BACKEND_DIR, '..', 'Dataset', 'medical_cases.csv')
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmark_results')
+MODEL_DIR = os.path.join(RESULTS_DIR, 'model')
+
+DEFAULT_SIZES = [1, 10, 100, 1000]
+
+
+def build_benchmark_model(model_dir=MODEL_DIR):
+    """Train the bundled benchmark model once; later runs reuse it"""
+    if os.path.exists(f'{model_dir}/model.joblib'):
+        return model_dir
+
+    print(f"Training benchmark model from {DATASET_PATH}...")
+    notes = pd.read_csv(DATASET_PATH).iloc[:, 0].astype(str)
+    processed = normalize_series(notes)
+
+    label_encoder = LabelEncoder()
+    y = label_encoder.fit_transform(default_labeler.label_series(notes))
+
+    # Same forest settings as train_model; min_df=1 because the dataset is tiny
+    tfidf = TfidfVectorizer(max_features=1000, min_df=1, max_df=0.9)
+    X = tfidf.fit_transform(processed)
+    model = RandomForestClassifier(n_estimators=100, max_depth=20, min_samples_split=5,
+                                   random_state=42, n_jobs=-1)
+    model.fit(X, y)
+
+    os.makedirs(model_dir, exist_ok=True)
+    joblib.dump(model, f'{model_dir}/model.joblib')
+    joblib.dump(tfidf, f'{model_dir}/tfidf_vectorizer.joblib')
+    joblib.dump(label_encoder, f'{model_dir}/label_encoder.joblib')
+    return model_dir
+
+
+def make_inputs(notes, size):
+    """Cycle through the dataset notes to build size inputs"""
+    return [notes[i % len(notes)] for i in range(size)]
+
+
+def _measure(fn, calls, repeats):
+    """Per-call latencies over repeats passes, plus peak traced memory"""
+    # Warm up lazy imports and caches before timing
+    fn(*calls[0])
+
+    latencies = []
+    for _ in range(repeats):
+        for args in calls:
+            start = time.perf_counter()
+            fn(*args)
+            latencies.append(time.perf_counter() - start)
+
+    # A separate traced pass, so tracemalloc overhead stays out of the timings
+    tracemalloc.start()
+    for args in calls:
+        fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return np.array(latencies), peak
+
+
+def _record(name, size, items_per_call, latencies, peak):
+    latencies_ms = latencies * 1000
+    return {
+        'benchmark': name,
+        'size': size,
+        'calls': len(latencies),
+        'throughput_per_s': items_per_call * len(latencies) / latencies.sum(),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'peak_memory_kb': peak / 1024
+    }
+
+
+def benchmark_cases(classifier, notes):
+    """Name, callable and argument builder for every benchmarked path
+
+    Each builder takes (notes, size) and returns (calls, items_per_call).
+    Per-item paths make one call per note; batch paths make one call for
+    all size notes.
+    """
+    def per_note(prepare=None):
+        def build(notes, size):
+            inputs = make_inputs(notes, size)
+            if prepare is not None:
+                inputs = [prepare(note) for note in inputs]
+            return [(note,) for note in inputs], 1
+        return build
+
+    def whole_batch(prepare=None):
+        def build(notes, size):
+            inputs = make_inputs(notes, size)
+            if prepare is not None:
+                inputs = [prepare(note) for note in inputs]
+            return [(inputs,)], size
+        return build
+
+    def whole_series(notes, size):
+        return [(pd.Series(make_inputs(notes, size)),)], size
+
+    def gauge_args(notes, size):
+        result = classifier.predict_single(notes[0])
+        calls = [(probability, f"{name} Severity Level", name)
+                 for name, probability in result['confidence_scores'].items()]
+        return [calls[i % len(calls)] for i in range(size)], 1
+
+    cases = [
+        ('normalize_text', normalize_text, per_note()),
+        ('normalize_series', normalize_series, whole_series),
+        ('tfidf_transform', classifier.tfidf.transform, whole_batch(normalize_text)),
+        ('predict_single', classifier.predict_single, per_note()),
+        ('predict_batch', classifier.predict_batch, whole_batch()),
+        ('analyze_duration_context', analyze_duration_context, per_note()),
+        ('create_gauge_chart', create_gauge_chart, gauge_args),
+    ]
+
+    try:
+        # Lexicon sentiment against the per-row TextBlob it replaces
+        sentiment = LexiconSentiment.from_textblob().fit(notes)
+        cases += [
+            ('sentiment_textblob', textblob_polarity, per_note()),
+            ('sentiment_lexicon', sentiment.score, whole_batch()),
+        ]
+    except ImportError:
+        print("Skipping sentiment benchmarks: textblob is not installed")
+
+    try:
+        # The original per-row training implementation needs the NLTK corpora
+        reference_preprocess_text("warm up")
+        cases.insert(0, ('preprocess_text_reference', reference_preprocess_text, per_note()))
+    except LookupError:
+        print("Skipping preprocess_text_reference: NLTK corpora are not downloaded")
+
+    try:
+        # The same model as one ONNX graph on onnxruntime's CPU provider
+        if 'onnx_pipeline' not in classifier.source:
+            export_model_dir(classifier.model_dir)
+        onnx_classifier = MedicalTextClassifier(classifier.model_dir, engine='onnx', cache_size=0)
+        cases += [
+            ('predict_single_onnx', onnx_classifier.predict_single, per_note()),
+            ('predict_batch_onnx', onnx_classifier.predict_batch, whole_batch()),
+        ]
+    except ImportError:
+        print("Skipping ONNX benchmarks: skl2onnx or onnxruntime is not installed")
+
+    return cases
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeats=3, only=None):
+    classifier = MedicalTextClassifier(build_benchmark_model(), cache_size=0)
+    notes = pd.read_csv(DATASET_PATH).iloc[:, 0].astype(str).tolist()
+
+    results = []
+    for name, fn, build in benchmark_cases(classifier, notes):
+        if only and name not in only:
+            continue
+        for size in sizes:
+            calls, items_per_call = build(notes, size)
+            latencies, peak = _measure(fn, calls, repeats)
+            record = _record(name, size, items_per_call, latencies, peak)
+            results.append(record)
+            print(f"{name:<26} size={size:<6} {record['throughput_per_s']:>12.1f}/s  "
+                  f"p50={record['p50_ms']:.3f}ms  p99={record['p99_ms']:.3f}ms  "
+                  f"peak={record['peak_memory_kb']:.0f}KB")
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(previous_path, results):
+    """Print throughput ratios of this run against an earlier results file"""
+    with open(previous_path) as f:
+        previous = {(r['benchmark'], r['size']): r for r in json.load(f)['results']}
+
+    print(f"\nThroughput vs {previous_path} (>1.00 is faster):")
+    for record in results:
+        old = previous.get((record['benchmark'], record['size']))
+        if old:
+            ratio = record['throughput_per_s'] / old['throughput_per_s']
+            print(f"- {record['benchmark']} size={record['size']}: {ratio:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the text-analysis hot paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help="Run only these benchmarks")
+    parser.add_argument('--output', help="Results file (default: benchmark_results/<timestamp>_<commit>.json)")
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.repeats, args.only)
+
+    commit = _git_commit()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = args.output or os.path.join(RESULTS_DIR, f'{timestamp}_{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'timestamp': timestamp,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': args.sizes,
+            'repeats': args.repeats,
+            'results': results
+        }, f, indent=2)
+    print(f"\nResults saved to: {output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
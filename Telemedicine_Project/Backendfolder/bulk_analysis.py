@@ -0,0 +1,92 @@
+"""Streaming, bounded-memory bulk analysis of uploaded case CSVs
+
+The CSV is read in chunks, each chunk is scored with one predict_batch
+call and written straight to a spooled output file, and only running
+summary metrics are kept. Memory use depends on the chunk size rather
+than on the size of the upload.
+"""
+
+import tempfile
+from collections import Counter
+
+import pandas as pd
+
+from chunking import DEFAULT_BATCH_SIZE
+
+# Output is kept in memory up to this size, then spills to a temp file
+SPOOL_MAX_BYTES = 32 * 1024 * 1024
+
+
+class BulkSummary:
+    def __init__(self):
+        """Running totals for the Analysis Summary cards"""
+        self.total_cases = 0
+        self.high_severity = 0
+        self.confidence_sum = 0.0
+        self.severity_counts = Counter()
+
+    def update(self, predictions, confidences):
+        self.total_cases += len(predictions)
+        self.severity_counts.update(predictions)
+        self.high_severity = self.severity_counts.get('High', 0)
+        self.confidence_sum += float(confidences.sum())
+
+    @property
+    def mean_confidence(self):
+        return self.confidence_sum / self.total_cases if self.total_cases else 0.0
+
+    def as_dict(self):
+        return {
+            'total_cases': self.total_cases,
+            'high_severity': self.high_severity,
+            'mean_confidence': self.mean_confidence,
+            'severity_distribution': dict(self.severity_counts)
+        }
+
+
+def score_chunk(classifier, chunk, text_column):
+    """Attach Severity_Level and Confidence_Score columns to one chunk"""
+    batch = classifier.predict_batch(chunk[text_column].tolist())
+    chunk['Severity_Level'] = batch['predictions']
+    chunk['Confidence_Score'] = batch['probabilities'].max(axis=1)
+    return chunk
+
+
+def _read_chunks(source, chunk_size):
+    """CSV chunks of source; an empty file has none"""
+    try:
+        yield from pd.read_csv(source, chunksize=chunk_size)
+    except pd.errors.EmptyDataError:
+        return
+
+
+def stream_bulk_analysis(source, classifier, chunk_size=DEFAULT_BATCH_SIZE,
+                         text_column=None, on_chunk=None, output=None):
+    """Score a CSV chunk by chunk into an output file
+
+    source is a path or file object accepted by pd.read_csv; the first
+    column holds the notes unless text_column is given. on_chunk, if set,
+    is called with (rows_done, summary, scored_chunk) after every chunk.
+    output is a binary file to write to, by default a spooled temporary
+    file. An empty source gives an empty output.
+    Returns the rewound output file and the BulkSummary.
+    """
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='w+b')
+    summary = BulkSummary()
+
+    for chunk in _read_chunks(source, chunk_size):
+        if text_column is None:
+            text_column = chunk.columns[0]
+
+        chunk = score_chunk(classifier, chunk, text_column)
+        summary.update(chunk['Severity_Level'].tolist(), chunk['Confidence_Score'].to_numpy())
+
+        # Only the first chunk writes the header row
+        chunk.to_csv(output, header=summary.total_cases == len(chunk), index=False)
+
+        if on_chunk is not None:
+            on_chunk(summary.total_cases, summary, chunk)
+
+    output.seek(0)
+    return output, summary
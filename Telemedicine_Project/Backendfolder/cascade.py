@@ -0,0 +1,147 @@
+"""Two-tier severity scoring: a linear fast tier with a forest fallback
+
+A logistic regression fitted on the same TF-IDF features scores every
+note with one sparse matrix product. The margin of a note is the gap
+between its two most probable classes under the linear model. Notes
+whose margin is below margin_threshold are rescored by the random
+forest, and their forest probabilities replace the linear ones.
+- margin_threshold=0 never falls back.
+- margin_threshold=1 always falls back, which gives the forest alone.
+
+CascadeScorer has the classes_/predict_proba interface of the forest
+engines, so MedicalTextClassifier uses it in their place (cascade=True)
+and the prediction cache and batching work unchanged. It counts scored
+notes and fallbacks for the fallback rate.
+
+Run with:
+    python cascade.py models/medical_classifier_<timestamp>.bundle --texts gpt-4.csv
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import stage
+
+DEFAULT_MARGIN_THRESHOLD = 0.3
+
+# Thresholds evaluated for the latency/accuracy trade-off
+DEFAULT_THRESHOLDS = (0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0)
+
+
+def linear_margin(proba):
+    """Gap between the highest and second-highest class probability of each row"""
+    if proba.shape[1] < 2:
+        return np.ones(proba.shape[0])
+    top_two = np.partition(proba, -2, axis=1)[:, -2:]
+    return top_two[:, 1] - top_two[:, 0]
+
+
+class CascadeScorer:
+    def __init__(self, linear, forest, margin_threshold=DEFAULT_MARGIN_THRESHOLD):
+        """Linear model first, forest for notes with a margin below margin_threshold"""
+        self.linear = linear
+        self.forest = forest
+        self.margin_threshold = margin_threshold
+        self.classes_ = forest.classes_
+        # Linear probability columns in the forest's class order
+        self._columns = np.searchsorted(linear.classes_, forest.classes_)
+        self.notes = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def predict_proba(self, X):
+        with stage('linear_predict'):
+            proba = self.linear.predict_proba(X)[:, self._columns]
+            fallback = np.flatnonzero(linear_margin(proba) < self.margin_threshold)
+        if len(fallback):
+            with stage('forest_fallback'):
+                proba[fallback] = self.forest.predict_proba(X[fallback])
+        with self._lock:
+            self.notes += X.shape[0]
+            self.fallbacks += len(fallback)
+        return proba
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    def stats(self):
+        """Notes scored, forest fallbacks and the fallback rate since loading"""
+        with self._lock:
+            return {
+                'notes': self.notes,
+                'fallbacks': self.fallbacks,
+                'fallback_rate': self.fallbacks / self.notes if self.notes else 0.0,
+                'margin_threshold': self.margin_threshold
+            }
+
+
+def cascade_tradeoff(linear, forest, X, y, thresholds=DEFAULT_THRESHOLDS, repeats=3):
+    """Fallback rate, accuracy, macro-F1 and scoring time of the cascade per threshold
+
+    y holds the encoded labels of the rows of X. Times are the best of
+    repeats batch runs, per 1000 notes, and include the linear pass.
+    """
+    from sklearn.metrics import f1_score
+
+    rows = []
+    for threshold in thresholds:
+        scorer = CascadeScorer(linear, forest, threshold)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            proba = scorer.predict_proba(X)
+            timings.append(time.perf_counter() - start)
+        predictions = scorer.classes_[np.argmax(proba, axis=1)]
+        rows.append({
+            'margin_threshold': threshold,
+            'fallback_rate': scorer.stats()['fallbacks'] / (repeats * X.shape[0]),
+            'accuracy': float((predictions == y).mean()),
+            'macro_f1': float(f1_score(y, predictions, average='macro')),
+            'ms_per_1000_notes': min(timings) / X.shape[0] * 1e6
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the linear/forest cascade on a set of notes")
+    parser.add_argument('bundle', help="Model bundle with a linear_model component")
+    parser.add_argument('--texts', required=True, help="CSV of notes, labeled with the keyword rules")
+    parser.add_argument('--column', help="Text column (default: the first column)")
+    parser.add_argument('--engine', default='sklearn', choices=['sklearn', 'flat'])
+    parser.add_argument('--margin', type=float, help="Threshold for the end-to-end comparison "
+                                                     "(default: the bundle's trained threshold)")
+    args = parser.parse_args()
+
+    from medical_classifier import MedicalTextClassifier
+    from severity_labeler import default_labeler
+
+    df = pd.read_csv(args.texts)
+    texts = df[args.column or df.columns[0]].dropna().tolist()
+
+    forest_only = MedicalTextClassifier(args.bundle, engine=args.engine, cache_size=0)
+    cascade = MedicalTextClassifier(args.bundle, engine=args.engine, cache_size=0,
+                                    cascade=True, fast_margin=args.margin)
+
+    processed = [forest_only.preprocess_text(text) for text in texts]
+    X = forest_only.tfidf.transform(processed)
+    y = forest_only.label_encoder.transform(default_labeler.label_series(pd.Series(processed)))
+
+    print(f"Cascade trade-off on {len(texts)} notes (scoring only):")
+    print(cascade_tradeoff(cascade.model.linear, forest_only.model, X, y).to_string(index=False))
+
+    print(f"\nEnd to end, margin threshold {cascade.model.margin_threshold}:")
+    for name, classifier in [('forest', forest_only), ('cascade', cascade)]:
+        start = time.perf_counter()
+        results = classifier.predict_batch(texts)
+        elapsed = time.perf_counter() - start
+        accuracy = (forest_only.label_encoder.transform(results['predictions']) == y).mean()
+        print(f"- {name}: {elapsed / len(texts) * 1000:.3f} ms/note, accuracy {accuracy:.4f}")
+    print(f"- fallbacks: {cascade.cascade_stats()}")
+
+
+if __name__ == "__main__":
+    main()
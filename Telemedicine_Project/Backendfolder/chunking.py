@@ -0,0 +1,14 @@
+"""Batch size and list chunking shared by training and serving
+
+Kept free of model and serving imports, so spawned preprocessing workers
+can use it without loading the classifier stack.
+"""
+
+# Number of notes scored per vectorized call in bulk analysis
+DEFAULT_BATCH_SIZE = 1000
+
+
+def iter_chunks(items, chunk_size=DEFAULT_BATCH_SIZE):
+    """Yield consecutive fixed-size slices of a list"""
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
@@ -0,0 +1,314 @@
+"""Compaction of the flat severity forest
+
+Shrinks the compiled forest of a model bundle in three steps:
+1. Subtree pruning: an internal node becomes a leaf when every leaf
+   below it has class probabilities within subtree_tolerance of the
+   node's own distribution. Each tree's output moves by at most that
+   tolerance, so the forest average does too.
+2. Tree dropping: trees are removed greedily, least influential first,
+   while the forest probabilities on a set of calibration notes stay
+   within tree_tolerance of the original forest.
+3. Narrow dtypes:
+   - Thresholds are stored as float32, rounded down. The trees compare
+     float32 inputs, so every split decision is unchanged.
+   - Leaf probabilities are quantized to uint16 with a scale factor.
+   - Feature indices are stored as uint16 when the vocabulary fits.
+
+The result is an ordinary FlatForest, written to a new bundle as its
+flat_forest component. By default the bundle goes to compact_models/
+beside the models directory, so a model watcher on that directory does
+not pick it up; promote it to serve it. The sklearn model and the ONNX graph hold the
+original forest, so they are left out, and MedicalTextClassifier loads
+the bundle with engine='flat'. check_engine_agreement confirms that
+every engine a bundle can serve gives the same predictions. The compact
+bundle gets its own version, so cached predictions of the original are
+not reused.
+
+Run with:
+    python forest_compaction.py models/medical_classifier_<timestamp>.bundle --texts gpt-4.csv
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from forest_engine import FlatForest
+from model_bundle import BUNDLE_EXTENSION, ModelBundle, write_bundle
+
+# Quantization levels of the uint16 leaf probabilities
+VALUE_LEVELS = np.iinfo(np.uint16).max
+
+# Directory, beside the source bundle's models directory, for compact bundles
+COMPACT_MODELS_DIR = 'compact_models'
+
+DEFAULT_SUBTREE_TOLERANCE = 0.01
+DEFAULT_TREE_TOLERANCE = 0.02
+
+
+def _rebuild(forest, trees, collapsed):
+    """Node arrays of the given trees, in preorder, with collapsed nodes as leaves"""
+    n_nodes = len(forest.feature)
+    left, right = forest.children_left, forest.children_right
+    leaf = (left == np.arange(n_nodes)) | collapsed
+
+    order, roots = [], []
+    max_depth = 0
+    for tree in trees:
+        roots.append(len(order))
+        stack = [(forest.roots[tree], 0)]
+        while stack:
+            node, depth = stack.pop()
+            order.append(node)
+            if leaf[node]:
+                max_depth = max(max_depth, depth)
+            else:
+                stack.append((right[node], depth + 1))
+                stack.append((left[node], depth + 1))
+
+    kept = np.asarray(order, dtype=np.int64)
+    new_id = np.full(n_nodes, -1, dtype=np.int64)
+    new_id[kept] = np.arange(len(kept))
+    kept_leaf = leaf[kept]
+    positions = np.arange(len(kept))
+    return FlatForest(
+        feature=np.where(kept_leaf, 0, forest.feature[kept]).astype(forest.feature.dtype),
+        threshold=forest.threshold[kept],
+        children_left=np.where(kept_leaf, positions, new_id[left[kept]]).astype(np.int32),
+        children_right=np.where(kept_leaf, positions, new_id[right[kept]]).astype(np.int32),
+        value=forest.value[kept],
+        roots=np.asarray(roots, dtype=np.int32),
+        classes=forest.classes_,
+        n_features=forest.n_features_in_,
+        max_depth=max_depth,
+        value_scale=forest.value_scale
+    )
+
+
+def prune_subtrees(forest, tolerance):
+    """Collapse subtrees whose leaves all lie within tolerance of their root's distribution"""
+    n_nodes = len(forest.feature)
+    left, right = forest.children_left, forest.children_right
+    is_leaf = left == np.arange(n_nodes)
+
+    # Per-class range of the leaf distributions under every node. Children
+    # always come after their parent, so a reverse sweep is bottom-up.
+    low = forest.value.copy()
+    high = forest.value.copy()
+    for node in range(n_nodes - 1, -1, -1):
+        if not is_leaf[node]:
+            low[node] = np.minimum(low[left[node]], low[right[node]])
+            high[node] = np.maximum(high[left[node]], high[right[node]])
+
+    deviation = np.maximum(high - forest.value, forest.value - low).max(axis=1)
+    return _rebuild(forest, range(forest.n_trees), ~is_leaf & (deviation <= tolerance))
+
+
+def select_trees(forest, X, reference, tolerance):
+    """Trees kept after greedily dropping those whose removal moves reference least
+
+    Stops before any probability on any row of X would differ from
+    reference by more than tolerance.
+    """
+    per_tree = forest.value[forest._leaves(X)]
+    total = per_tree.sum(axis=1)
+    kept = list(range(forest.n_trees))
+    while len(kept) > 1:
+        without = (total[:, None, :] - per_tree[:, kept, :]) / (len(kept) - 1)
+        deviation = np.abs(without - reference[:, None, :]).max(axis=(0, 2))
+        best = int(np.argmin(deviation))
+        if deviation[best] > tolerance:
+            break
+        total -= per_tree[:, kept[best], :]
+        kept.pop(best)
+    return kept
+
+
+def narrow(forest):
+    """Same forest with float32 thresholds, uint16 probabilities and, if they fit, uint16 features"""
+    threshold = forest.threshold.astype(np.float32)
+    # Round down, so x <= threshold holds for exactly the same float32 inputs
+    rounded_up = threshold.astype(np.float64) > forest.threshold
+    threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+
+    probabilities = forest.value if forest.value_scale is None else forest.value * forest.value_scale
+    feature_dtype = np.uint16 if forest.n_features_in_ <= np.iinfo(np.uint16).max else np.int32
+    return FlatForest(
+        feature=forest.feature.astype(feature_dtype),
+        threshold=threshold,
+        children_left=forest.children_left,
+        children_right=forest.children_right,
+        value=np.round(probabilities * VALUE_LEVELS).astype(np.uint16),
+        roots=forest.roots,
+        classes=forest.classes_,
+        n_features=forest.n_features_in_,
+        max_depth=forest.max_depth,
+        value_scale=1.0 / VALUE_LEVELS
+    )
+
+
+def compact_forest(forest, X, subtree_tolerance=DEFAULT_SUBTREE_TOLERANCE,
+                   tree_tolerance=DEFAULT_TREE_TOLERANCE):
+    """Prune subtrees, drop trees against calibration rows X, then narrow the dtypes"""
+    reference = forest.predict_proba(X)
+    pruned = prune_subtrees(forest, subtree_tolerance)
+    kept = select_trees(pruned, X, reference, tree_tolerance)
+    return narrow(_rebuild(pruned, kept, np.zeros(len(pruned.feature), dtype=bool)))
+
+
+def write_compact_bundle(bundle_path, compact, settings, output_path=None):
+    """Copy a bundle with compact as its flat forest and without the sklearn model"""
+    source = ModelBundle(bundle_path)
+    if output_path is None:
+        models_dir, name = os.path.split(os.path.abspath(bundle_path))
+        compact_dir = os.path.join(os.path.dirname(models_dir), COMPACT_MODELS_DIR)
+        os.makedirs(compact_dir, exist_ok=True)
+        output_path = os.path.join(compact_dir, f'{name[:-len(BUNDLE_EXTENSION)]}_compact{BUNDLE_EXTENSION}')
+    # Components holding the original forest would serve it instead of the compact one
+    components = {name: source.load(name) for name in source.manifest['components']
+                  if name not in ('model', 'flat_forest', 'onnx_pipeline')}
+    components['flat_forest'] = compact
+
+    manifest = {key: value for key, value in source.manifest.items() if key not in ('format', 'components')}
+    manifest.update(version=f'{source.version}_compact', compacted_from=source.version,
+                    model_type='FlatForest', compaction=settings)
+    write_bundle(output_path, components, manifest)
+    return output_path
+
+
+def check_engine_agreement(bundle_path, texts, atol=1e-5):
+    """Compare the predictions of every engine a bundle can serve on texts
+
+    Engines that disagree serve different forests. The ONNX graph
+    computes in float32, hence the tolerance.
+    """
+    from medical_classifier import ENGINE_COMPONENTS, MedicalTextClassifier
+
+    source = ModelBundle(bundle_path)
+    engines = [engine for engine, component in ENGINE_COMPONENTS.items() if component in source]
+    results = {engine: MedicalTextClassifier(bundle_path, engine=engine, cache_size=0).predict_batch(texts)
+               for engine in engines}
+    reference = results[engines[0]]
+
+    report = {
+        'engines': engines,
+        'max_abs_proba_diff': max(float(np.abs(result['probabilities'] - reference['probabilities']).max())
+                                  if len(texts) else 0.0 for result in results.values()),
+        'label_mismatches': sum(int((result['predictions'] != reference['predictions']).sum())
+                                for result in results.values())
+    }
+    report['passed'] = report['max_abs_proba_diff'] <= atol and report['label_mismatches'] == 0
+    return report
+
+
+def _measure(classifier, texts, labels, repeats=3):
+    """Load-independent metrics of one classifier on the evaluation notes"""
+    from sklearn.metrics import f1_score
+
+    X = classifier.tfidf.transform([classifier.preprocess_text(text) for text in texts])
+    proba = classifier.model.predict_proba(X)
+    predictions = classifier.label_encoder.inverse_transform(classifier.model.classes_[np.argmax(proba, axis=1)])
+
+    single = []
+    for row in range(min(100, X.shape[0])):
+        start = time.perf_counter()
+        classifier.model.predict_proba(X[row])
+        single.append(time.perf_counter() - start)
+    batch = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        classifier.model.predict_proba(X)
+        batch.append(time.perf_counter() - start)
+
+    return proba, predictions, {
+        'single_ms_p50': float(np.median(single)) * 1000,
+        'batch_ms': min(batch) * 1000,
+        'accuracy': float((predictions == labels).mean()),
+        'macro_f1': float(f1_score(labels, predictions, average='macro'))
+    }
+
+
+def compaction_report(bundle_path, compact_path, texts):
+    """Size, load time, latency and accuracy of the original engines and the compact forest
+
+    Accuracy is measured against the keyword severity labels of texts,
+    which should not include the calibration notes.
+    """
+    from medical_classifier import MedicalTextClassifier
+    from severity_labeler import default_labeler
+
+    rows = {}
+    reference = None
+    for name, path, engine in [('sklearn', bundle_path, 'sklearn'), ('flat', bundle_path, 'flat'),
+                               ('compact', compact_path, 'flat')]:
+        start = time.perf_counter()
+        classifier = MedicalTextClassifier(path, engine=engine, cache_size=0)
+        load_seconds = time.perf_counter() - start
+
+        processed = pd.Series([classifier.preprocess_text(text) for text in texts])
+        labels = default_labeler.label_series(processed).to_numpy()
+        proba, predictions, metrics = _measure(classifier, texts, labels)
+        if reference is None:
+            reference = (proba, predictions)
+
+        component = 'model' if engine == 'sklearn' else 'flat_forest'
+        rows[name] = {
+            'bundle_bytes': os.path.getsize(path),
+            'forest_bytes': classifier.source.manifest['components'][component]['bytes'],
+            'load_seconds': load_seconds,
+            **metrics,
+            'agreement': float((predictions == reference[1]).mean()),
+            'max_proba_diff': float(np.abs(proba - reference[0]).max())
+        }
+
+    report = pd.DataFrame(rows).T
+    for column in ['bundle_bytes', 'forest_bytes', 'load_seconds', 'single_ms_p50', 'batch_ms',
+                   'accuracy', 'macro_f1']:
+        report[f'{column}_delta'] = report[column] - report.loc['sklearn', column]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact the forest of a model bundle")
+    parser.add_argument('bundle', help="Model bundle with a flat_forest component")
+    parser.add_argument('--texts', required=True,
+                        help="CSV of notes; half calibrate tree dropping, half measure the report")
+    parser.add_argument('--column', help="Text column (default: the first column)")
+    parser.add_argument('--subtree-tolerance', type=float, default=DEFAULT_SUBTREE_TOLERANCE)
+    parser.add_argument('--tree-tolerance', type=float, default=DEFAULT_TREE_TOLERANCE)
+    parser.add_argument('--output', help="Compact bundle path "
+                                         f"(default: {COMPACT_MODELS_DIR}/<bundle>_compact.bundle beside the models dir)")
+    args = parser.parse_args()
+
+    from medical_classifier import MedicalTextClassifier
+
+    df = pd.read_csv(args.texts)
+    texts = df[args.column or df.columns[0]].dropna().sample(frac=1.0, random_state=42).tolist()
+    calibration, evaluation = texts[:len(texts) // 2], texts[len(texts) // 2:]
+
+    classifier = MedicalTextClassifier(args.bundle, engine='flat', cache_size=0)
+    X = classifier.tfidf.transform([classifier.preprocess_text(text) for text in calibration])
+    compact = compact_forest(classifier.model, X, args.subtree_tolerance, args.tree_tolerance)
+    print(f"Trees: {classifier.model.n_trees} -> {compact.n_trees}, "
+          f"nodes: {len(classifier.model.feature)} -> {len(compact.feature)}, "
+          f"arrays: {classifier.model.nbytes:,} -> {compact.nbytes:,} bytes")
+
+    settings = {'subtree_tolerance': args.subtree_tolerance, 'tree_tolerance': args.tree_tolerance,
+                'calibration_notes': len(calibration)}
+    compact_path = write_compact_bundle(args.bundle, compact, settings, args.output)
+    print(f"Compact bundle saved in: {compact_path}")
+
+    agreement = check_engine_agreement(compact_path, evaluation)
+    print(f"Engine agreement: {agreement}")
+    if not agreement['passed']:
+        raise SystemExit(f"The engines of {compact_path} disagree")
+
+    print("\nCompaction report (deltas against the original sklearn forest):")
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(compaction_report(args.bundle, compact_path, evaluation).T)
+
+
+if __name__ == "__main__":
+    main()
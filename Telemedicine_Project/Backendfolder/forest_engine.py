@@ -0,0 +1,264 @@
+"""Array-backed inference engine for the severity RandomForest
+
+Compiles a fitted RandomForestClassifier into flat NumPy node arrays and
+evaluates CSR TF-IDF rows against them directly. Features that are absent
+from a sparse row are read as 0, so the input is never densified.
+"""
+
+import argparse
+import time
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+
+FLAT_FOREST_FILE = 'flat_forest.joblib'
+
+# Rows evaluated together; bounds the (rows x trees) working set
+ROW_BLOCK_SIZE = 2048
+
+
+class FlatForest:
+    def __init__(self, feature, threshold, children_left, children_right,
+                 value, roots, classes, n_features, max_depth, value_scale=None):
+        """Wrap compiled node arrays of every tree in the forest
+
+        value holds per-node class distributions; when it is quantized
+        to integers (see forest_compaction.py), value_scale maps it back
+        to probabilities.
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        self.n_features_in_ = int(n_features)
+        self.max_depth = int(max_depth)
+        self.value_scale = value_scale
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Compile a fitted RandomForestClassifier into flat arrays"""
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point at themselves so every row can take the same
+            # number of steps through the tree
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+            # Per-node class distribution, as used by predict_proba
+            value = tree.value[:, 0, :].astype(np.float64)
+            value /= np.maximum(value.sum(axis=1, keepdims=True), 1e-12)
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(left)
+            rights.append(right)
+            values.append(value)
+            roots.append(offset)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children_left=np.concatenate(lefts).astype(np.int32),
+            children_right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            classes=np.asarray(forest.classes_),
+            n_features=forest.n_features_in_,
+            max_depth=max_depth
+        )
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Load a compiled forest saved with save()
+
+        With mmap_mode='r' the node arrays are memory-mapped, so processes
+        on one host loading the same file share its pages.
+        """
+        arrays = joblib.load(path, mmap_mode=mmap_mode)
+        return cls(**arrays)
+
+    def arrays(self):
+        """Constructor arguments: the node arrays plus the scalar sizes"""
+        return {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'children_left': self.children_left,
+            'children_right': self.children_right,
+            'value': self.value,
+            'roots': self.roots,
+            'classes': self.classes_,
+            'n_features': self.n_features_in_,
+            'max_depth': self.max_depth,
+            'value_scale': self.value_scale
+        }
+
+    def save(self, path):
+        """Save the node arrays uncompressed so they can be memory-mapped"""
+        joblib.dump(self.arrays(), path)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        """Total size of the node arrays"""
+        return sum(value.nbytes for value in self.arrays().values() if isinstance(value, np.ndarray))
+
+    def _leaves(self, X):
+        """Return the leaf reached by every (row, tree) pair"""
+        n_rows = X.shape[0]
+
+        # Key every stored entry by (row, column) so a single sorted
+        # search finds any feature of any row; misses are zeros
+        X = X.tocsr()
+        X.sort_indices()
+        row_of_entry = np.repeat(np.arange(n_rows, dtype=np.int64), np.diff(X.indptr))
+        keys = row_of_entry * self.n_features_in_ + X.indices
+        # Trees split on float32 inputs in sklearn, so compare the same way
+        data = np.append(X.data.astype(np.float32).astype(np.float64), 0.0)
+        # Sentinel slot for queries past the last stored entry
+        padded_keys = np.append(keys, -1)
+
+        nodes = np.tile(self.roots, n_rows)
+        # Only pairs still at an internal node are advanced each step
+        active = np.arange(len(nodes))
+        active_rows = np.repeat(np.arange(n_rows, dtype=np.int64), self.n_trees)
+        for _ in range(self.max_depth):
+            current = nodes[active]
+            query = active_rows * self.n_features_in_ + self.feature[current]
+            position = np.searchsorted(keys, query)
+            values = np.where(padded_keys[position] == query, data[position], 0.0)
+
+            go_left = values <= self.threshold[current]
+            current = np.where(go_left, self.children_left[current], self.children_right[current])
+            nodes[active] = current
+
+            internal = self.children_left[current] != current
+            if not internal.all():
+                active = active[internal]
+                active_rows = active_rows[internal]
+            if len(active) == 0:
+                break
+
+        return nodes.reshape(n_rows, self.n_trees)
+
+    def predict_proba(self, X):
+        """Average the leaf class distributions over all trees"""
+        if not sp.issparse(X):
+            X = sp.csr_matrix(X)
+
+        blocks = []
+        for start in range(0, X.shape[0], ROW_BLOCK_SIZE):
+            leaves = self._leaves(X[start:start + ROW_BLOCK_SIZE])
+            proba = self.value[leaves].mean(axis=1)
+            blocks.append(proba if self.value_scale is None else proba * self.value_scale)
+
+        if not blocks:
+            return np.zeros((0, len(self.classes_)))
+        return np.vstack(blocks)
+
+    def predict(self, X):
+        """Return the class with the highest averaged probability"""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def compile_model_dir(model_dir):
+    """Compile model.joblib of a pre-bundle model directory into flat_forest.joblib"""
+    from model_bundle import ModelDirectory
+
+    forest = ModelDirectory(model_dir).load('model')
+    flat_forest = FlatForest.from_sklearn(forest)
+    path = f'{model_dir}/{FLAT_FOREST_FILE}'
+    flat_forest.save(path)
+    print(f"Compiled {flat_forest.n_trees} trees "
+          f"({len(flat_forest.feature)} nodes) into: {path}")
+    return flat_forest
+
+
+def check_parity(forest, flat_forest, X, atol=1e-9):
+    """Compare flat engine outputs with sklearn; returns mismatch counts"""
+    sklearn_proba = forest.predict_proba(X)
+    flat_proba = flat_forest.predict_proba(X)
+    sklearn_pred = forest.predict(X)
+    flat_pred = flat_forest.predict(X)
+
+    report = {
+        'rows': X.shape[0],
+        'max_abs_proba_diff': float(np.abs(sklearn_proba - flat_proba).max()) if X.shape[0] else 0.0,
+        'label_mismatches': int((sklearn_pred != flat_pred).sum())
+    }
+    report['passed'] = report['max_abs_proba_diff'] <= atol and report['label_mismatches'] == 0
+    return report
+
+
+def compare_latency(forest, flat_forest, X, repeats=5):
+    """Time predict_proba for both engines on single rows and the full batch"""
+    def best_of(fn):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    single_row = X[:1]
+    return {
+        'sklearn_single_ms': best_of(lambda: forest.predict_proba(single_row)) * 1000,
+        'flat_single_ms': best_of(lambda: flat_forest.predict_proba(single_row)) * 1000,
+        'sklearn_batch_ms': best_of(lambda: forest.predict_proba(X)) * 1000,
+        'flat_batch_ms': best_of(lambda: flat_forest.predict_proba(X)) * 1000,
+        'batch_rows': X.shape[0]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile and verify the flat forest engine")
+    parser.add_argument('model', help="Model bundle, or a pre-bundle model directory to compile into")
+    parser.add_argument('--texts', help="CSV of notes used for the parity and latency check")
+    args = parser.parse_args()
+
+    from model_bundle import ModelDirectory, open_model
+
+    source = open_model(args.model)
+    if isinstance(source, ModelDirectory):
+        flat_forest = compile_model_dir(args.model)
+    else:
+        # Bundles are exported with the compiled forest
+        flat_forest = source.load('flat_forest')
+        print(f"Loaded {flat_forest.n_trees} trees ({len(flat_forest.feature)} nodes) from: {args.model}")
+    if not args.texts:
+        return
+
+    import pandas as pd
+    from medical_classifier import MedicalTextClassifier
+
+    classifier = MedicalTextClassifier(args.model, cache_size=0)
+    texts = pd.read_csv(args.texts).iloc[:, 0].tolist()
+    X = classifier.tfidf.transform([classifier.preprocess_text(text) for text in texts])
+
+    print("\nParity against sklearn:")
+    for key, value in check_parity(classifier.model, flat_forest, X).items():
+        print(f"- {key}: {value}")
+
+    print("\nLatency comparison:")
+    for key, value in compare_latency(classifier.model, flat_forest, X).items():
+        print(f"- {key}: {value:.3f}" if isinstance(value, float) else f"- {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Successive-halving hyperparameter search for the severity classifier
+
+Evaluates a grid of forest configurations, plus extra-trees and
+logistic-regression alternatives, on the cached pipeline artifacts. The
+shared TF-IDF matrix comes from the featurize stage and the labels from
+the labels stage, so nothing is re-vectorized.
+
+Successive halving:
+- Every candidate starts on a small subsample of each training fold.
+- Survivors move to the next rung, which trains on eta times more
+  notes. The last rung trains on the full folds.
+- Each rung keeps the top 1/eta candidates by mean macro-F1. It also
+  keeps every candidate on the rung's accuracy/latency frontier, so
+  cheap models are not dropped only for being slightly less accurate.
+
+Every (candidate, fold) fit runs as one task in a spawned process pool.
+Workers memory-map the cached TF-IDF matrix. For each fit the worker
+records:
+- macro-F1 on the held-out fold
+- fit time
+- median single-note predict_proba latency
+- pickled model size
+
+Latency is measured while the other workers are busy, so it is best used
+to compare configurations. benchmark_suite.py gives absolute numbers.
+Fold indices and the full results table are cached in the ArtifactStore
+under a key of the upstream stage keys and the search settings.
+
+Run with:
+    python hyperparameter_search.py gpt-4.csv
+    python hyperparameter_search.py gpt-4.csv --min-f1 0.95 --output search_results.csv
+"""
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from stage_artifacts import ArtifactStore, content_hash
+from training_pipeline import TrainingPipeline
+
+# Grids per model type; every combination is one candidate
+SEARCH_SPACE = {
+    'random_forest': {
+        'n_estimators': [25, 50, 100, 200],
+        'max_depth': [10, 20, None],
+        'min_samples_split': [2, 5]
+    },
+    'extra_trees': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [20, None]
+    },
+    'logistic_regression': {
+        'C': [0.1, 1.0, 10.0]
+    }
+}
+
+# Settings shared by every candidate of a model type. Trees run
+# single-threaded because the pool already spreads fits across cores.
+FIXED_PARAMS = {
+    'random_forest': {'random_state': 42, 'n_jobs': 1},
+    'extra_trees': {'random_state': 42, 'n_jobs': 1},
+    'logistic_regression': {'max_iter': 1000}
+}
+
+# Held-out notes timed one at a time per fit
+LATENCY_SAMPLE = 50
+
+_worker_data = None
+
+
+def make_model(model, params):
+    from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+
+    estimators = {
+        'random_forest': RandomForestClassifier,
+        'extra_trees': ExtraTreesClassifier,
+        'logistic_regression': LogisticRegression
+    }
+    return estimators[model](**FIXED_PARAMS.get(model, {}), **params)
+
+
+def iter_candidates(space=SEARCH_SPACE):
+    """One {'model', 'params'} dict per combination of each model's grid"""
+    for model, grid in space.items():
+        names = list(grid)
+        for values in itertools.product(*(grid[name] for name in names)):
+            yield {'model': model, 'params': dict(zip(names, values))}
+
+
+def _init_worker(features_path, y, folds):
+    global _worker_data
+    # The sparse matrix's arrays are memory-mapped and shared between workers
+    matrix = joblib.load(features_path, mmap_mode='r')['matrix']
+    _worker_data = (matrix, y, folds)
+
+
+def _evaluate(task):
+    """Fit one candidate on the first n_samples notes of a training fold and score it"""
+    from sklearn.metrics import f1_score
+
+    candidate_id, candidate, fold, n_samples = task
+    matrix, y, folds = _worker_data
+    train_rows = folds['train'][fold][:n_samples]
+    test_rows = folds['test'][fold]
+
+    model = make_model(candidate['model'], candidate['params'])
+    start = time.perf_counter()
+    model.fit(matrix[train_rows], y[train_rows])
+    fit_seconds = time.perf_counter() - start
+
+    X_test = matrix[test_rows]
+    macro_f1 = f1_score(y[test_rows], model.predict(X_test), average='macro',
+                        labels=np.unique(y), zero_division=0)
+
+    latencies = []
+    for row in range(min(LATENCY_SAMPLE, X_test.shape[0])):
+        start = time.perf_counter()
+        model.predict_proba(X_test[row])
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        'candidate': candidate_id,
+        'fold': fold,
+        'macro_f1': macro_f1,
+        'fit_seconds': fit_seconds,
+        'latency_ms': float(np.median(latencies)) * 1000,
+        'model_bytes': len(pickle.dumps(model))
+    }
+
+
+def latency_frontier(results):
+    """Rows no other row beats on both macro-F1 and latency, fastest first"""
+    ordered = results.sort_values(['latency_ms', 'macro_f1'], ascending=[True, False])
+    frontier = []
+    best_f1 = -math.inf
+    for index, macro_f1 in ordered['macro_f1'].items():
+        if macro_f1 > best_f1:
+            frontier.append(index)
+            best_f1 = macro_f1
+    return ordered.loc[frontier]
+
+
+def cheapest_meeting(results, min_f1):
+    """Fastest full-data configuration with mean macro-F1 of at least min_f1, or None"""
+    final = results[results['rung'] == results['rung'].max()]
+    eligible = final[final['macro_f1'] >= min_f1]
+    if eligible.empty:
+        return None
+    return eligible.sort_values(['latency_ms', 'model_bytes']).iloc[0]
+
+
+class SuccessiveHalvingSearch:
+    def __init__(self, pipeline, space=SEARCH_SPACE, n_splits=3, eta=3, min_samples=100,
+                 n_workers=None, random_state=42):
+        """Search over space using the featurize and labels artifacts of pipeline
+
+        The first rung trains on at least min_samples notes per fold.
+        n_workers defaults to all cores and, like the pipeline's worker
+        count, is not part of the cache key.
+        """
+        self.pipeline = pipeline
+        self.store = pipeline.store
+        self.space = space
+        self.n_splits = n_splits
+        self.eta = eta
+        self.min_samples = min_samples
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.random_state = random_state
+        self.candidates = list(iter_candidates(space))
+
+    def _upstream_keys(self):
+        return [self.pipeline.key('featurize'), self.pipeline.key('labels')]
+
+    def folds_key(self):
+        return content_hash(self._upstream_keys(), {'n_splits': self.n_splits,
+                                                    'random_state': self.random_state})
+
+    def key(self):
+        return content_hash([self.folds_key()], {'space': self.space, 'fixed': FIXED_PARAMS,
+                                                 'eta': self.eta, 'min_samples': self.min_samples,
+                                                 'latency_sample': LATENCY_SAMPLE})
+
+    def folds(self, y):
+        """Stratified folds over the TF-IDF rows, cached; training rows are shuffled once"""
+        key = self.folds_key()
+        if self.store.exists('search_folds', key):
+            return self.store.load_object('search_folds', key)
+
+        from sklearn.model_selection import StratifiedKFold
+
+        rng = np.random.default_rng(self.random_state)
+        splitter = StratifiedKFold(self.n_splits, shuffle=True, random_state=self.random_state)
+        folds = {'train': [], 'test': []}
+        for train_rows, test_rows in splitter.split(np.zeros(len(y)), y):
+            # Rungs train on a prefix of this order, so small rungs are random subsamples
+            folds['train'].append(rng.permutation(train_rows))
+            folds['test'].append(test_rows)
+        self.store.save_object('search_folds', key, folds)
+        return folds
+
+    def rung_sizes(self, n_train):
+        """Training notes per fold at each rung, growing by eta up to n_train"""
+        n_rungs = 1 + int(math.log(len(self.candidates), self.eta))
+        # Fewer rungs when the smallest would fall below min_samples
+        n_rungs = max(1, min(n_rungs, 1 + int(math.log(max(n_train / self.min_samples, 1), self.eta))))
+        return [n_train // self.eta ** (n_rungs - 1 - rung) for rung in range(n_rungs)]
+
+    def _promote(self, scores):
+        """Top 1/eta candidates by macro-F1, plus the rung's latency frontier"""
+        n_keep = max(1, math.ceil(len(scores) / self.eta))
+        ranked = scores.sort_values(['macro_f1', 'latency_ms'], ascending=[False, True])
+        keep = set(ranked['candidate'].iloc[:n_keep]) | set(latency_frontier(scores)['candidate'])
+        return sorted(keep)
+
+    def run(self, force=False):
+        """Run the search, or load its cached results
+
+        Returns one row per candidate and rung with the fold means of
+        macro_f1, fit_seconds, latency_ms and model_bytes.
+        """
+        self.pipeline.refresh()
+        key = self.key()
+        if self.store.is_table('search_results', key) and not force:
+            print(f"[search] up to date ({key})")
+            return self.store.load('search_results', key)
+
+        from sklearn.preprocessing import LabelEncoder
+
+        # labels depends on featurize through the feature stage
+        self.pipeline.run('labels')
+        y = LabelEncoder().fit_transform(self.pipeline.load('labeled', ['severity'])['severity'])
+        folds = self.folds(y)
+        features_path = self.store.path('tfidf_features', self.pipeline.key('featurize'), 'joblib')
+
+        sizes = self.rung_sizes(min(len(rows) for rows in folds['train']))
+        print(f"[search] running ({key}): {len(self.candidates)} candidates, "
+              f"{self.n_splits} folds, rungs of {sizes} notes")
+
+        context = multiprocessing.get_context('spawn')
+        pool = context.Pool(self.n_workers, initializer=_init_worker, initargs=(features_path, y, folds))
+        rungs = []
+        try:
+            survivors = list(range(len(self.candidates)))
+            for rung, n_samples in enumerate(sizes):
+                tasks = [(candidate_id, self.candidates[candidate_id], fold, n_samples)
+                         for candidate_id in survivors for fold in range(self.n_splits)]
+                start = time.perf_counter()
+                fits = pd.DataFrame(pool.imap_unordered(_evaluate, tasks))
+                scores = fits.drop(columns='fold').groupby('candidate', as_index=False).mean()
+                scores['rung'] = rung
+                scores['n_samples'] = n_samples
+                rungs.append(scores)
+                print(f"Rung {rung}: {len(survivors)} candidates on {n_samples} notes, "
+                      f"best macro-F1 {scores['macro_f1'].max():.4f} "
+                      f"({time.perf_counter() - start:.1f}s)")
+                if rung < len(sizes) - 1:
+                    survivors = self._promote(scores)
+        finally:
+            pool.close()
+            pool.join()
+
+        results = pd.concat(rungs, ignore_index=True)
+        results.insert(1, 'model', [self.candidates[i]['model'] for i in results['candidate']])
+        results.insert(2, 'params', [json.dumps(self.candidates[i]['params'], sort_keys=True)
+                                     for i in results['candidate']])
+        self.store.save('search_results', key, results)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Successive-halving search over classifier settings")
+    parser.add_argument('source', help="Source CSV with data and conversation columns")
+    parser.add_argument('--artifacts', default='artifacts', help="Stage artifact directory")
+    parser.add_argument('--workers', type=int, help="Search processes (default: all cores)")
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--eta', type=int, default=3, help="Survivor ratio and sample growth per rung")
+    parser.add_argument('--min-samples', type=int, default=100, help="Training notes per fold at the first rung")
+    parser.add_argument('--min-f1', type=float, help="Accuracy bar for picking the cheapest configuration")
+    parser.add_argument('--output', help="Also write every rung's results to this CSV")
+    parser.add_argument('--force', action='store_true', help="Rerun the search even if it is cached")
+    args = parser.parse_args()
+
+    pipeline = TrainingPipeline(args.source, ArtifactStore(args.artifacts), n_workers=args.workers)
+    search = SuccessiveHalvingSearch(pipeline, n_splits=args.folds, eta=args.eta,
+                                     min_samples=args.min_samples, n_workers=args.workers)
+    results = search.run(force=args.force)
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+    columns = ['model', 'params', 'macro_f1', 'latency_ms', 'fit_seconds', 'model_bytes']
+    final = results[results['rung'] == results['rung'].max()]
+    print("\nFull-data results:")
+    print(final.sort_values('macro_f1', ascending=False)[columns].to_string(index=False))
+    print("\nAccuracy/latency frontier:")
+    print(latency_frontier(final)[columns].to_string(index=False))
+
+    if args.min_f1 is not None:
+        best = cheapest_meeting(results, args.min_f1)
+        if best is None:
+            print(f"\nNo configuration reaches macro-F1 {args.min_f1}")
+        else:
+            print(f"\nCheapest configuration with macro-F1 >= {args.min_f1}: "
+                  f"{best['model']} {best['params']} "
+                  f"(macro-F1 {best['macro_f1']:.4f}, {best['latency_ms']:.2f} ms/note)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Headless HTTP inference service for the severity classifier
+
+Single-note requests arriving concurrently are coalesced into micro-batches
+and scored with one vectorized predict_batch call. A batch is flushed when
+it reaches max_batch_size or when its oldest request has waited
+max_wait_ms, which bounds the latency added by batching.
+
+With --models-dir the service follows a models directory instead of one
+model: a newly exported or promoted bundle is loaded, warmed and swapped
+in without a restart (see model_watcher.py). Each batch is scored
+entirely on the model that was current when it started.
+
+Run with:
+    python inference_service.py --model-dir models/medical_classifier_<timestamp>.bundle
+    python inference_service.py --models-dir models
+
+Endpoints:
+    POST /predict  {"text": "..."}  -> {"prediction": ..., "confidence_scores": {...}}
+    GET  /health
+    GET  /stats
+    GET  /metrics  (Prometheus text format, with --metrics)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from instrumentation import enable_metrics, get_hook, stage, MetricsRegistry
+from model_registry import get_classifier
+from model_watcher import DEFAULT_POLL_SECONDS, ModelWatcher
+
+
+class MicroBatcher:
+    def __init__(self, classifier, max_batch_size=64, max_wait_ms=5):
+        """Collect concurrent requests and score them in batches"""
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.requests = 0
+        self._worker = None
+
+    def start(self):
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    async def predict(self, text):
+        """Queue one note and wait for its prediction"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def _next_batch(self):
+        """Wait for one request, then gather more until full or timed out"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                # Score off the event loop so new requests keep queueing
+                results = await loop.run_in_executor(None, self.classifier.predict_batch, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            for i, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                future.set_result({
+                    'prediction': str(results['predictions'][i]),
+                    'confidence_scores': {
+                        str(class_name): float(probability)
+                        for class_name, probability in zip(results['classes'],
+                                                           results['probabilities'][i])
+                    }
+                })
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'queued': self.queue.qsize(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000
+        }
+
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+def _response(status, payload):
+    if isinstance(payload, str):
+        body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+    else:
+        body, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n")
+    return head.encode('ascii') + body
+
+
+async def _read_request(reader):
+    """Parse one HTTP/1.1 request; returns None when the client closed"""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+class InferenceService:
+    def __init__(self, classifier, max_batch_size=64, max_wait_ms=5):
+        self.batcher = MicroBatcher(classifier, max_batch_size, max_wait_ms)
+        self.classifier = classifier
+
+    async def handle(self, method, path, body):
+        """Route one request and return (status, payload)"""
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok', 'model_version': self.classifier.model_version}
+        if method == 'GET' and path == '/stats':
+            stats = {'batching': self.batcher.stats(), 'cache': self.classifier.cache_stats(),
+                     'cascade': self.classifier.cascade_stats()}
+            if isinstance(self.classifier, ModelWatcher):
+                stats['model'] = self.classifier.stats()
+            return 200, stats
+        if method == 'GET' and path == '/metrics':
+            hook = get_hook()
+            if not isinstance(hook, MetricsRegistry):
+                return 404, {'error': 'Metrics are disabled; start with --metrics'}
+            return 200, hook.exposition()
+        if method == 'POST' and path == '/predict':
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError:
+                request = None
+            text = request.get('text') if isinstance(request, dict) else None
+            if not isinstance(text, str):
+                return 400, {'error': 'Expected a JSON object with a string "text" field'}
+            try:
+                # Queueing, batching and scoring as seen by the client
+                with stage('request'):
+                    return 200, await self.batcher.predict(text)
+            except Exception as e:
+                return 500, {'error': str(e)}
+        return 404, {'error': f'No route for {method} {path}'}
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self.handle(method, path, body)
+                writer.write(_response(status, payload))
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8600):
+        self.batcher.start()
+        server = await asyncio.start_server(self._serve_connection, host, port)
+        print(f"Inference service listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching HTTP inference service")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--model-dir', help="Model bundle or pre-bundle model directory")
+    source.add_argument('--models-dir', help="Directory of bundles; serves its current model and reloads it "
+                                             "when a new one is exported or promoted")
+    parser.add_argument('--poll-seconds', type=float, default=DEFAULT_POLL_SECONDS,
+                        help="How often --models-dir is checked for a new model")
+    parser.add_argument('--engine', choices=['sklearn', 'flat', 'onnx'],
+                        help="Inference engine (default: flat when the model has a compiled forest)")
+    parser.add_argument('--cascade', action='store_true',
+                        help="Score with the linear fast tier, falling back to the forest on low margins")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--metrics', action='store_true', help="Record per-stage timings at /metrics")
+    args = parser.parse_args()
+
+    # Model loads and hot swaps are logged
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    if args.metrics:
+        enable_metrics()
+
+    if args.models_dir:
+        classifier = ModelWatcher(args.models_dir, args.engine, args.cascade, args.poll_seconds).start()
+    else:
+        classifier = get_classifier(args.model_dir, engine=args.engine, cascade=args.cascade)
+    service = InferenceService(classifier, args.max_batch_size, args.max_wait_ms)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nInference service stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Per-stage timing instrumentation for classification requests
+
+Code under measurement wraps each stage in `with stage('name'):`. The
+durations go to a pluggable hook: any callable taking (stage, seconds).
+When no hook is installed, stage() returns a shared no-op context
+manager, so disabled instrumentation costs one global lookup per stage.
+
+enable_metrics() installs an in-memory MetricsRegistry. It keeps a
+histogram per stage and renders a Prometheus-style text exposition.
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+
+# Upper bounds in seconds, from sub-millisecond regex work to slow renders
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_hook = None
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class _StageTimer:
+    __slots__ = ('hook', 'name', 'start')
+
+    def __init__(self, hook, name):
+        self.hook = hook
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.hook(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """Context manager timing one stage; a no-op when no hook is set"""
+    hook = _hook
+    if hook is None:
+        return _NULL_TIMER
+    return _StageTimer(hook, name)
+
+
+def set_hook(hook):
+    """Install a callable(stage, seconds), or None to disable timing"""
+    global _hook
+    _hook = hook
+
+
+def get_hook():
+    return _hook
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self, prefix='mediscan', buckets=DEFAULT_BUCKETS):
+        """In-memory stage-duration histograms; usable directly as a hook"""
+        self.prefix = prefix
+        self.buckets = buckets
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name, seconds):
+        self.observe(name, seconds)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def summary(self):
+        """Count, total and mean seconds per stage"""
+        with self._lock:
+            return {
+                name: {
+                    'count': histogram.count,
+                    'sum_seconds': histogram.sum,
+                    'mean_seconds': histogram.sum / histogram.count if histogram.count else 0.0
+                }
+                for name, histogram in self.histograms.items()
+            }
+
+    def exposition(self):
+        """Render all histograms in the Prometheus text format"""
+        metric = f'{self.prefix}_stage_duration_seconds'
+        lines = [
+            f'# HELP {metric} Time spent in each classification stage.',
+            f'# TYPE {metric} histogram'
+        ]
+        with self._lock:
+            for name in sorted(self.histograms):
+                histogram = self.histograms[name]
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {histogram.sum}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def enable_metrics(registry=None):
+    """Install a MetricsRegistry as the hook (reusing the current one) and return it"""
+    if registry is None:
+        registry = _hook if isinstance(_hook, MetricsRegistry) else MetricsRegistry()
+    set_hook(registry)
+    return registry
@@ -0,0 +1,96 @@
+"""Concurrent load generator for inference_service.py
+
+Opens a number of keep-alive connections that each send single-note
+/predict requests back to back, then reports throughput and latency
+percentiles.
+
+    python load_generator.py --texts ../Dataset/medical_cases.csv --concurrency 64 --requests 5000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+
+async def _post(reader, writer, host, text):
+    body = json.dumps({'text': text}).encode('utf-8')
+    writer.write((f"POST /predict HTTP/1.1\r\nHost: {host}\r\n"
+                  f"Content-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode('ascii') + body)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status_line.split()[1] == b'200'
+
+
+async def _client(host, port, texts, counter, total, latencies, failures):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            index = counter[0]
+            if index >= total:
+                break
+            counter[0] += 1
+            start = time.perf_counter()
+            ok = await _post(reader, writer, host, texts[index % len(texts)])
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                failures[0] += 1
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, texts, concurrency, total):
+    """Send total requests over concurrency connections; returns a summary"""
+    counter, failures, latencies = [0], [0], []
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, texts, counter, total, latencies, failures)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'failures': failures[0],
+        'concurrency': concurrency,
+        'elapsed_s': elapsed,
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'max_ms': float(latencies_ms.max())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the inference service")
+    parser.add_argument('--texts', required=True, help="CSV whose first column holds the notes")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    texts = pd.read_csv(args.texts).iloc[:, 0].astype(str).tolist()
+    summary = asyncio.run(run_load(args.host, args.port, texts, args.concurrency, args.requests))
+
+    print("\nLoad test summary:")
+    for key, value in summary.items():
+        print(f"- {key}: {value:.2f}" if isinstance(value, float) else f"- {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import numpy as np
+
+from cascade import DEFAULT_MARGIN_THRESHOLD, CascadeScorer
+from instrumentation import stage
+from model_bundle import open_model
+from onnx_backend import OnnxPipeline
+from prediction_cache import PredictionCache, cache_key
+from text_normalizer import SERVING_MEMO_SIZE, Preprocessor
+
+# Bundle component each engine scores with
+ENGINE_COMPONENTS = {'sklearn': 'model', 'flat': 'flat_forest', 'onnx': 'onnx_pipeline'}
+
+class MedicalTextClassifier:
+    def __init__(self, model_dir, engine='sklearn', mmap_mode=None,
+                 cache_size=10000, cache_ttl=None, cascade=False, fast_margin=None):
+        """Initialize the classifier with saved model components
+
+        model_dir is a model bundle (see model_bundle.py) or a model
+        directory from before bundles; bundle components are checked
+        against their manifest checksums as they load.
+        engine='flat' scores with the compiled flat forest (see
+        forest_engine.py) instead of unpickling the sklearn model, and
+        engine='onnx' runs the exported TF-IDF + forest graph on
+        onnxruntime (see onnx_backend.py).
+        mmap_mode='r' memory-maps the forest arrays of the flat engine.
+        The sklearn engine always copies the forest into memory, since
+        unpickling its trees copies their node arrays.
+        Predictions are cached per preprocessed text in an LRU of
+        cache_size entries (0 disables it), optionally expiring after
+        cache_ttl seconds.
+        cascade=True scores with the linear fast tier first and falls
+        back to the forest below the fast_margin margin (default: the
+        threshold stored with the model), see cascade.py.
+        """
+        self.source = open_model(model_dir)
+        if engine == 'flat':
+            self.model = self.source.load('flat_forest', mmap_mode=mmap_mode)
+        elif engine == 'sklearn':
+            self.model = self.source.load('model')
+        elif engine == 'onnx':
+            self.model = OnnxPipeline(self.source.load('onnx_pipeline'))
+        else:
+            raise ValueError(f"Unknown inference engine: {engine}")
+        if cascade and engine == 'onnx':
+            raise ValueError("The cascade needs TF-IDF features; use the sklearn or flat engine")
+        if cascade:
+            if fast_margin is None:
+                fast_margin = self.source.manifest.get('cascade', {}).get(
+                    'margin_threshold', DEFAULT_MARGIN_THRESHOLD)
+            self.model = CascadeScorer(self.source.load('linear_model'), self.model, fast_margin)
+        self.engine = engine
+        self.model_dir = model_dir
+        self.tfidf = self.source.load('tfidf_vectorizer')
+        self.label_encoder = self.source.load('label_encoder')
+
+        # Seeded with the lemmas of the training vocabulary, so serving
+        # does not need WordNet; other tokens are memoized in a bounded LRU
+        self.preprocessor = Preprocessor(
+            lemma_table=self.source.load('lemma_table') if 'lemma_table' in self.source else None,
+            memo_size=SERVING_MEMO_SIZE)
+
+        # Loaded by the feature_importance property when explanations are requested
+        self._feature_importance = None
+
+        # The bundle manifest (or timestamped directory name) identifies the version
+        self.model_version = self.source.version
+        self.cache = PredictionCache(cache_size, cache_ttl) if cache_size > 0 else None
+
+    @property
+    def feature_importance(self):
+        """Global term importances of the forest, loaded on first use"""
+        if self._feature_importance is None:
+            self._feature_importance = self.source.load('feature_importance')
+        return self._feature_importance
+
+    def preprocess_text(self, text):
+        """Normalize the input text exactly as the training corpus was"""
+        return self.preprocessor.process_text(text)
+
+    def predict_single(self, text):
+        """Make prediction for a single text input"""
+        batch = self.predict_batch([text])
+
+        # Get confidence scores
+        class_probabilities = dict(zip(batch['classes'], batch['probabilities'][0]))
+
+        return {
+            'prediction': batch['predictions'][0],
+            'confidence_scores': class_probabilities,
+            'processed_text': batch['processed_texts'][0]
+        }
+
+    def predict_batch(self, texts):
+        """Make predictions for a batch of texts in one vectorized pass
+
+        Returns column-form results: an array of predicted labels, a
+        (n_texts, n_classes) probability matrix and the class order.
+        """
+        # Preprocess every text; only cache misses are vectorized and scored
+        with stage('preprocess'):
+            processed_texts = [self.preprocess_text(text) for text in texts]
+        prediction_proba = self._cached_proba(processed_texts)
+
+        # Decode the predictions
+        with stage('label_decode'):
+            prediction_encoded = self.model.classes_[np.argmax(prediction_proba, axis=1)]
+            predictions = self.label_encoder.inverse_transform(prediction_encoded)
+
+        return {
+            'predictions': predictions,
+            'probabilities': prediction_proba,
+            'classes': self.label_encoder.classes_[self.model.classes_],
+            'processed_texts': processed_texts
+        }
+
+    def _cached_proba(self, processed_texts):
+        """Class probabilities, scoring only texts missing from the cache"""
+        if self.cache is None:
+            return self._score(processed_texts)
+
+        prediction_proba = np.empty((len(processed_texts), len(self.model.classes_)))
+
+        # Group positions of uncached texts so duplicates are scored once
+        miss_positions = {}
+        with stage('cache_lookup'):
+            for position, processed_text in enumerate(processed_texts):
+                key = cache_key(processed_text, self.model_version)
+                if key in miss_positions:
+                    miss_positions[key].append(position)
+                    continue
+                cached = self.cache.get(key)
+                if cached is None:
+                    miss_positions[key] = [position]
+                else:
+                    prediction_proba[position] = cached
+
+        if miss_positions:
+            miss_texts = [processed_texts[positions[0]] for positions in miss_positions.values()]
+            for (key, positions), row in zip(miss_positions.items(), self._score(miss_texts)):
+                prediction_proba[positions] = row
+                # Copy so the cache does not pin the whole batch matrix
+                self.cache.put(key, row.copy())
+
+        return prediction_proba
+
+    def _score(self, processed_texts):
+        """Vectorize preprocessed texts into one sparse matrix and score it"""
+        if self.engine == 'onnx':
+            # TF-IDF runs inside the graph
+            with stage('onnx_predict'):
+                return self.model.predict_proba(processed_texts)
+        with stage('tfidf_transform'):
+            texts_tfidf = self.tfidf.transform(processed_texts)
+        with stage('forest_predict'):
+            return self.model.predict_proba(texts_tfidf)
+
+    def explain(self, text, top_n=10):
+        """Terms of a note ranked by TF-IDF weight times global importance"""
+        row = self.tfidf.transform([self.preprocess_text(text)])
+        terms = self.tfidf.get_feature_names_out()[row.indices]
+        importance = self.feature_importance['importance'].reindex(terms).fillna(0.0).to_numpy()
+        contributions = row.data * importance
+        order = np.argsort(-contributions)[:top_n]
+        return list(zip(terms[order], contributions[order]))
+
+    def cache_stats(self):
+        """Hit, miss and eviction counters of the prediction cache"""
+        return self.cache.stats() if self.cache is not None else None
+
+    def cascade_stats(self):
+        """Fallback counters of the linear/forest cascade, when enabled"""
+        return self.model.stats() if isinstance(self.model, CascadeScorer) else None
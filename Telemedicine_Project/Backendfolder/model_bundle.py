@@ -0,0 +1,281 @@
+"""Single-file, versioned model bundles with a manifest
+
+A bundle is an uncompressed ZIP archive (medical_classifier_<timestamp>.bundle)
+holding manifest.json and one member per model component:
+- joblib members: model, linear_model, tfidf_vectorizer,
+  label_encoder, feature_importance, lemma_table
+- JSON members: severity_rules
+- raw members: onnx_pipeline, the serialized ONNX graph (see
+  onnx_backend.py)
+- array members: the flat forest (or its compacted form, see
+  forest_compaction.py), one .npy file per node array. These are
+  stored 64-byte aligned, so they can be memory-mapped straight out of
+  the bundle and their pages shared between processes.
+
+The manifest records the bundle format, model version, creation time,
+model type, classes, feature count and, for every member, its SHA-256
+and size. Opening a bundle reads only the manifest. A component is read
+when first requested, and its bytes are checked against the manifest
+before they are unpickled, so a corrupt or tampered component fails to
+load instead of loading wrong. verify() checks every member's checksum
+without unpickling anything.
+
+Model directories written before bundles existed still load through
+ModelDirectory, which has the same load interface but no checksums.
+
+Run with:
+    python model_bundle.py models/medical_classifier_<timestamp>.bundle
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import struct
+import zipfile
+
+import joblib
+import numpy as np
+
+from forest_engine import FLAT_FOREST_FILE, FlatForest
+from onnx_backend import ONNX_FILE
+from severity_labeler import SEVERITY_RULES_FILE
+from text_normalizer import LEMMA_TABLE_FILE
+
+BUNDLE_EXTENSION = '.bundle'
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = 'manifest.json'
+
+# Member data offsets are padded to this, so arrays map with natural alignment
+ARRAY_ALIGNMENT = 64
+
+# Zip extra-field id used for alignment padding (as in Android's zipalign)
+_PADDING_HEADER_ID = 0xD935
+_LOCAL_HEADER_SIZE = 30
+
+# Files of each component in a pre-bundle model directory
+DIRECTORY_FILES = {
+    'model': 'model.joblib',
+    'tfidf_vectorizer': 'tfidf_vectorizer.joblib',
+    'label_encoder': 'label_encoder.joblib',
+    'feature_importance': 'feature_importance.joblib',
+    'lemma_table': LEMMA_TABLE_FILE,
+    'flat_forest': FLAT_FOREST_FILE,
+    'linear_model': 'linear_model.joblib',
+    'onnx_pipeline': ONNX_FILE,
+    'severity_rules': SEVERITY_RULES_FILE
+}
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _joblib_bytes(obj):
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer)
+    return buffer.getvalue()
+
+
+def _npy_bytes(array):
+    buffer = io.BytesIO()
+    np.lib.format.write_array(buffer, np.ascontiguousarray(array), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _write_member(archive, name, data, align=False):
+    """Add a stored member; with align the data starts on an ARRAY_ALIGNMENT boundary"""
+    info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_STORED
+    if align:
+        data_start = archive.fp.tell() + _LOCAL_HEADER_SIZE + len(name.encode('utf-8')) + 4
+        padding = -data_start % ARRAY_ALIGNMENT
+        info.extra = struct.pack('<HH', _PADDING_HEADER_ID, padding) + b'\0' * padding
+    archive.writestr(info, data)
+    return {'file': name, 'sha256': _sha256(data), 'bytes': len(data)}
+
+
+def write_bundle(path, components, manifest):
+    """Write components into a bundle at path and return its manifest
+
+    components maps names to objects. FlatForest components are stored
+    as arrays, bytes as they are and severity_rules as JSON; everything
+    else is stored with joblib. manifest holds the descriptive fields (version,
+    classes, n_features, ...); the format and member checksums are
+    added here. The bundle is written beside path and renamed into
+    place, so readers never see a partial file.
+    """
+    manifest = dict(manifest, format=BUNDLE_FORMAT, components={})
+    tmp_path = f'{path}.tmp'
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as archive:
+        for name, obj in components.items():
+            if isinstance(obj, FlatForest):
+                arrays = obj.arrays()
+                entry = {'kind': 'arrays', 'arrays': {}, 'scalars': {}}
+                for field, value in arrays.items():
+                    if isinstance(value, np.ndarray):
+                        entry['arrays'][field] = _write_member(
+                            archive, f'{name}/{field}.npy', _npy_bytes(value), align=True)
+                    else:
+                        entry['scalars'][field] = value
+                entry['bytes'] = sum(member['bytes'] for member in entry['arrays'].values())
+            elif isinstance(obj, bytes):
+                entry = dict(_write_member(archive, f'{name}.bin', obj), kind='bytes')
+            elif name == 'severity_rules':
+                data = json.dumps(obj, indent=2).encode('utf-8')
+                entry = dict(_write_member(archive, f'{name}.json', data), kind='json')
+            else:
+                entry = dict(_write_member(archive, f'{name}.joblib', _joblib_bytes(obj)), kind='joblib')
+            manifest['components'][name] = entry
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2, default=str))
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def is_bundle(path):
+    return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+
+class ModelBundle:
+    def __init__(self, path, verify=True):
+        """Open a bundle, reading only its manifest
+
+        With verify=True every component is checked against its
+        manifest checksum when it is loaded.
+        """
+        self.path = path
+        self.verify_on_load = verify
+        with zipfile.ZipFile(path) as archive:
+            self.manifest = json.loads(archive.read(MANIFEST_NAME))
+        if self.manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"Unsupported bundle format in {path}: {self.manifest.get('format')}")
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def classes(self):
+        return self.manifest['classes']
+
+    @property
+    def n_features(self):
+        return self.manifest['n_features']
+
+    def __contains__(self, name):
+        return name in self.manifest['components']
+
+    def _read(self, archive, member, verify=None):
+        """Bytes of one member; zip CRC errors are reported as checksum mismatches"""
+        try:
+            data = archive.read(member['file'])
+        except zipfile.BadZipFile as error:
+            raise ValueError(f"Checksum mismatch for {member['file']} in {self.path}") from error
+        if (self.verify_on_load if verify is None else verify) and _sha256(data) != member['sha256']:
+            raise ValueError(f"Checksum mismatch for {member['file']} in {self.path}")
+        return data
+
+    def _data_offset(self, archive, name):
+        """Position of a stored member's bytes in the bundle file"""
+        info = archive.getinfo(name)
+        with open(self.path, 'rb') as f:
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+        return info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+
+    def _map_array(self, archive, member):
+        """Memory-map one .npy member in place"""
+        if self.verify_on_load:
+            self._read(archive, member)
+        offset = self._data_offset(archive, member['file'])
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            version = np.lib.format.read_magic(f)
+            shape, fortran_order, dtype = (np.lib.format.read_array_header_1_0(f) if version == (1, 0)
+                                           else np.lib.format.read_array_header_2_0(f))
+            array_offset = f.tell()
+        if int(np.prod(shape)) == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=array_offset, shape=shape,
+                         order='F' if fortran_order else 'C')
+
+    def load(self, name, mmap_mode=None):
+        """Load one component, checking its checksum first
+
+        mmap_mode='r' memory-maps the flat forest arrays; other
+        components are always read into memory.
+        """
+        if name not in self:
+            raise KeyError(f"{self.path} has no '{name}' component")
+        entry = self.manifest['components'][name]
+        with zipfile.ZipFile(self.path) as archive:
+            if entry['kind'] == 'arrays':
+                arrays = {}
+                for field, member in entry['arrays'].items():
+                    if mmap_mode is not None:
+                        arrays[field] = self._map_array(archive, member)
+                    else:
+                        arrays[field] = np.load(io.BytesIO(self._read(archive, member)))
+                return FlatForest(**arrays, **entry['scalars'])
+            data = self._read(archive, entry)
+        if entry['kind'] == 'json':
+            return json.loads(data)
+        if entry['kind'] == 'bytes':
+            return data
+        return joblib.load(io.BytesIO(data))
+
+    def verify(self):
+        """Check every member against the manifest; returns the names checked"""
+        checked = []
+        with zipfile.ZipFile(self.path) as archive:
+            for name, entry in self.manifest['components'].items():
+                members = entry['arrays'].values() if entry['kind'] == 'arrays' else [entry]
+                for member in members:
+                    self._read(archive, member, verify=True)
+                checked.append(name)
+        return checked
+
+
+class ModelDirectory:
+    def __init__(self, path):
+        """A model directory written before bundles; components are loose files"""
+        self.path = path
+        self.version = os.path.basename(os.path.normpath(path))
+        self.manifest = {}
+
+    def __contains__(self, name):
+        return os.path.exists(os.path.join(self.path, DIRECTORY_FILES[name]))
+
+    def load(self, name, mmap_mode=None):
+        path = os.path.join(self.path, DIRECTORY_FILES[name])
+        if name == 'flat_forest':
+            return FlatForest.load(path, mmap_mode=mmap_mode)
+        if name == 'severity_rules':
+            with open(path) as f:
+                return json.load(f)
+        if name == 'onnx_pipeline':
+            with open(path, 'rb') as f:
+                return f.read()
+        return joblib.load(path)
+
+
+def open_model(path, verify=True):
+    """A ModelBundle for a bundle file, a ModelDirectory otherwise"""
+    return ModelBundle(path, verify=verify) if is_bundle(path) else ModelDirectory(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show and verify a model bundle")
+    parser.add_argument('bundle', help="Path to a .bundle file")
+    args = parser.parse_args()
+
+    bundle = ModelBundle(args.bundle)
+    for key, value in bundle.manifest.items():
+        if key != 'components':
+            print(f"{key}: {value}")
+    print(f"\nVerified components: {', '.join(bundle.verify())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Process-wide registry of loaded MedicalTextClassifier instances
+
+Each model directory is loaded once per process and shared by every
+Streamlit session and worker thread. Without an explicit engine, models
+with a compiled flat forest load with engine='flat': its arrays are
+memory-mapped read-only, so all processes on a host that load the same
+model share the forest pages through the OS page cache. The sklearn
+engine unpickles the forest, which copies its node arrays into every
+process.
+"""
+
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+
+from medical_classifier import MedicalTextClassifier
+from model_bundle import open_model
+
+logger = logging.getLogger(__name__)
+
+_classifiers = {}
+_load_stats = {}
+_lock = threading.Lock()
+
+
+def _resident_bytes():
+    """Current resident set size of this process"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # Peak RSS is the best portable fallback (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _mapped_bytes(model):
+    """Total size of the memory-mapped arrays held by a model"""
+    # A cascade maps the arrays of its forest tier
+    model = getattr(model, 'forest', model)
+    return sum(value.nbytes for value in vars(model).values()
+               if isinstance(value, np.memmap))
+
+
+def default_engine(model_dir):
+    """Prefer the memory-mappable flat engine when it has been compiled"""
+    return 'flat' if 'flat_forest' in open_model(model_dir) else 'sklearn'
+
+
+def _key(model_dir, engine, cascade):
+    return (os.path.abspath(model_dir), engine or default_engine(model_dir), cascade)
+
+
+def get_classifier(model_dir, engine=None, mmap_mode='r', cascade=False):
+    """Return the shared classifier for a model, loading it once; engine=None picks default_engine"""
+    key = _key(model_dir, engine, cascade)
+    engine = key[1]
+    classifier = _classifiers.get(key)
+    if classifier is not None:
+        return classifier
+
+    with _lock:
+        # Another thread may have finished loading while we waited
+        if key in _classifiers:
+            return _classifiers[key]
+
+        rss_before = _resident_bytes()
+        start = time.perf_counter()
+        classifier = MedicalTextClassifier(model_dir, engine=engine, mmap_mode=mmap_mode, cascade=cascade)
+        load_seconds = time.perf_counter() - start
+
+        _load_stats[key] = {
+            'model_dir': model_dir,
+            'engine': engine,
+            'cascade': cascade,
+            'load_seconds': load_seconds,
+            'resident_bytes': max(_resident_bytes() - rss_before, 0),
+            'mapped_bytes': _mapped_bytes(classifier.model),
+            'loaded_at': time.time()
+        }
+        _classifiers[key] = classifier
+        logger.info("Loaded %s model from %s in %.2fs", engine, model_dir, load_seconds)
+        return classifier
+
+
+def get_load_stats(model_dir=None, engine=None, cascade=False):
+    """Load time and memory figures; all models when model_dir is None"""
+    if model_dir is None:
+        return list(_load_stats.values())
+    return _load_stats.get(_key(model_dir, engine, cascade))
+
+
+def evict(model_dir, engine=None, cascade=False):
+    """Drop a model from the registry so the next lookup reloads it"""
+    key = _key(model_dir, engine, cascade)
+    with _lock:
+        _load_stats.pop(key, None)
+        return _classifiers.pop(key, None) is not None
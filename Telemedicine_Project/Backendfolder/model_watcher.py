@@ -0,0 +1,264 @@
+"""Hot reload of the serving model from a models directory
+
+ModelWatcher serves the model that a models directory designates:
+- the model named by its `current` pointer, a text file holding a
+  bundle path (relative to the directory) or a symlink to one
+- otherwise the newest exported bundle, by the timestamp in its
+  medical_classifier_<YYYYmmdd_HHMMSS>.bundle name. Derived bundles such
+  as <name>_compact.bundle do not match, so they are only served once
+  promoted.
+
+A background thread checks the directory every poll_seconds. A new
+model is loaded on that thread, warmed with a few predictions and only
+then swapped in with a single reference assignment. Requests take
+current() once and keep that classifier until they finish, so in-flight
+requests complete on the old model. After the swap the old model is
+evicted from the model registry and its parallel scorers are released,
+so its memory is freed once its last in-flight request returns.
+
+Each model is loaded with the engine its bundle supports: the requested
+engine when the bundle has its component, otherwise flat when it has a
+compiled forest (compact bundles have no sklearn model) and sklearn
+when it does not (streamed SGD bundles have no flat forest).
+
+A model that fails to load or warm up is logged and skipped until the
+pointer changes again; the old model keeps serving.
+
+Run with:
+    python model_watcher.py models --promote models/medical_classifier_<timestamp>.bundle
+"""
+
+import argparse
+import gc
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from medical_classifier import ENGINE_COMPONENTS
+from model_bundle import BUNDLE_EXTENSION, open_model
+from model_registry import default_engine, evict, get_classifier
+from parallel_scoring import reinstate_parallel_scorers, release_parallel_scorers
+
+CURRENT_POINTER = 'current'
+# Names of bundles exported by the training pipeline
+BUNDLE_PATTERN = re.compile(rf'medical_classifier_(\d{{8}}_\d{{6}}){re.escape(BUNDLE_EXTENSION)}')
+DEFAULT_POLL_SECONDS = 5.0
+
+# Notes scored by a new model before it is swapped in
+WARMUP_TEXTS = [
+    "Patient reports a mild headache since this morning, vitals stable.",
+    "Severe chest pain radiating to the left arm with shortness of breath.",
+    "Follow-up visit for a sprained ankle, swelling has gone down.",
+    "High fever and persistent vomiting for two days."
+]
+
+logger = logging.getLogger(__name__)
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def resolve_current(models_dir):
+    """Path of the model a models directory designates, or None when it has none"""
+    pointer = os.path.join(models_dir, CURRENT_POINTER)
+    if os.path.islink(pointer):
+        return os.path.realpath(pointer)
+    if os.path.isfile(pointer):
+        with open(pointer) as f:
+            target = f.read().strip()
+        return os.path.abspath(os.path.join(models_dir, target))
+    exported = {}
+    for name in os.listdir(models_dir) if os.path.isdir(models_dir) else []:
+        match = BUNDLE_PATTERN.fullmatch(name)
+        try:
+            exported[datetime.strptime(match.group(1), '%Y%m%d_%H%M%S')] = name
+        except (AttributeError, ValueError):
+            # Not an exported bundle, or not a real timestamp
+            continue
+    if not exported:
+        return None
+    return os.path.abspath(os.path.join(models_dir, exported[max(exported)]))
+
+
+def promote(models_dir, model_path):
+    """Point the models directory at a model; the pointer is replaced atomically"""
+    pointer = os.path.join(models_dir, CURRENT_POINTER)
+    tmp_path = f'{pointer}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(os.path.relpath(os.path.abspath(model_path), os.path.abspath(models_dir)) + '\n')
+    os.replace(tmp_path, pointer)
+    return pointer
+
+
+class ModelWatcher:
+    def __init__(self, models_dir, engine=None, cascade=False, poll_seconds=DEFAULT_POLL_SECONDS,
+                 warmup_texts=WARMUP_TEXTS):
+        """Serve the designated model of models_dir, reloading it when it changes
+
+        engine and cascade are preferences, applied to each model whose
+        bundle supports them; engine=None picks default_engine.
+        """
+        self.models_dir = models_dir
+        self.engine = engine
+        self.cascade = cascade
+        self.poll_seconds = poll_seconds
+        self.warmup_texts = list(warmup_texts)
+        self.model_path = None
+        # Engine and cascade setting of the served model, its registry key
+        self.model_engine = None
+        self.model_cascade = False
+        self.swaps = 0
+        self.swapped_at = None
+        self.last_error = None
+        self._classifier = None
+        self._failed_path = None
+        self._check_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        """The classifier to use for one whole request"""
+        classifier = self._classifier
+        if classifier is None:
+            raise RuntimeError(f"No model found in {self.models_dir}")
+        return classifier
+
+    def _load_options(self, path):
+        """Engine and cascade setting for a model, from its bundle's components"""
+        source = open_model(path)
+        engine = self.engine
+        if engine is None or ENGINE_COMPONENTS[engine] not in source:
+            engine = default_engine(path)
+            if self.engine is not None:
+                logger.warning("%s has no %s component; loading it with the %s engine",
+                               path, ENGINE_COMPONENTS[self.engine], engine)
+        cascade = self.cascade and engine != 'onnx' and 'linear_model' in source
+        return engine, cascade
+
+    def _warm_up(self, classifier):
+        results = classifier.predict_batch(self.warmup_texts)
+        if (len(results['predictions']) != len(self.warmup_texts)
+                or not np.isfinite(results['probabilities']).all()):
+            raise ValueError("Warm-up predictions are incomplete or not finite")
+
+    def check(self):
+        """Load, warm and swap in the designated model if it changed; returns whether it swapped"""
+        with self._check_lock:
+            path = resolve_current(self.models_dir)
+            if path is None or path in (self.model_path, self._failed_path):
+                return False
+
+            engine, cascade = None, False
+            # A model promoted back after a swap may use process pools again
+            reinstate_parallel_scorers(path)
+            try:
+                engine, cascade = self._load_options(path)
+                classifier = get_classifier(path, engine=engine, cascade=cascade)
+                self._warm_up(classifier)
+            except Exception as e:
+                if engine is not None:
+                    evict(path, engine, cascade)
+                self._failed_path = path
+                self.last_error = f"{path}: {e}"
+                logger.exception("Could not load %s, still serving %s", path, self.model_path)
+                return False
+
+            old_path, old_engine, old_cascade = self.model_path, self.model_engine, self.model_cascade
+            # The swap: requests started from here on get the new model
+            self._classifier = classifier
+            self.model_path, self.model_engine, self.model_cascade = path, engine, cascade
+            self._failed_path = None
+            self.swapped_at = time.time()
+            logger.info("Serving model %s from %s with the %s engine%s", classifier.model_version, path,
+                        engine, ' and cascade' if cascade else '')
+
+            if old_path is not None:
+                self.swaps += 1
+                # In-flight requests still hold the old classifier; it is freed after they return
+                evict(old_path, old_engine, old_cascade)
+                release_parallel_scorers(old_path)
+                gc.collect()
+            return True
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Model check of %s failed", self.models_dir)
+
+    def start(self):
+        """Load the current model, then keep checking for a new one in the background"""
+        if self._classifier is None:
+            self.check()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._poll, name='model-watcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # The classifier interface, each call on the model current when it starts
+
+    @property
+    def model_version(self):
+        return self.current().model_version
+
+    def predict_single(self, text):
+        return self.current().predict_single(text)
+
+    def predict_batch(self, texts):
+        return self.current().predict_batch(texts)
+
+    def cache_stats(self):
+        return self.current().cache_stats()
+
+    def cascade_stats(self):
+        return self.current().cascade_stats()
+
+    def stats(self):
+        """Model being served, swap count and the last load failure"""
+        return {
+            'models_dir': self.models_dir,
+            'model_path': self.model_path,
+            'model_version': self._classifier.model_version if self._classifier is not None else None,
+            'engine': self.model_engine,
+            'cascade': self.model_cascade,
+            'swaps': self.swaps,
+            'swapped_at': self.swapped_at,
+            'last_error': self.last_error
+        }
+
+
+def get_model_watcher(models_dir, engine=None, cascade=False, poll_seconds=DEFAULT_POLL_SECONDS):
+    """Return the process-wide, started watcher of a models directory"""
+    key = (os.path.abspath(models_dir), engine, cascade)
+    with _watchers_lock:
+        if key not in _watchers:
+            _watchers[key] = ModelWatcher(models_dir, engine, cascade, poll_seconds).start()
+        return _watchers[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or change the model a models directory serves")
+    parser.add_argument('models_dir', help="Directory of model bundles")
+    parser.add_argument('--promote', help="Model bundle to serve from now on")
+    args = parser.parse_args()
+
+    if args.promote:
+        print(f"Updated {promote(args.models_dir, args.promote)}")
+    print(f"Current model: {resolve_current(args.models_dir)}")
+
+
+if __name__ == "__main__":
+    main()
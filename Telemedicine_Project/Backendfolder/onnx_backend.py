@@ -0,0 +1,184 @@
+"""ONNX export of the TF-IDF + forest pipeline and an onnxruntime backend
+
+export_onnx converts the fitted TfidfVectorizer and RandomForest into a
+single ONNX graph with skl2onnx:
+- Input: a column of preprocessed note strings.
+- In the graph: tokenization, TF-IDF weighting, the tree ensemble, and
+  the mapping from encoded classes back to severity names.
+- Outputs: the predicted labels and the class probabilities.
+
+Text normalization stays in Python (Preprocessor with the exported
+lemma table), so both backends see the same processed text. That text
+is already lowercase, so the graph is exported without the TF-IDF
+lowercase step. The step would add a StringNormalizer node, which needs
+an en_US locale on the serving host.
+
+OnnxPipeline runs the graph on onnxruntime's CPU execution provider,
+with onnxruntime's default intra-op thread count (one per physical
+core) unless n_threads is given.
+MedicalTextClassifier(engine='onnx') uses it in place of the TF-IDF
+transform and the forest. skl2onnx and onnxruntime are optional
+dependencies: only export and the onnx engine need them.
+
+Run with:
+    python onnx_backend.py models/medical_classifier_<timestamp>.bundle --texts gpt-4.csv
+"""
+
+import argparse
+import copy
+import json
+import time
+
+import joblib
+import numpy as np
+
+ONNX_FILE = 'pipeline.onnx'
+
+# Metadata key holding the encoded class of each probability column
+CLASSES_METADATA_KEY = 'mediscan.classes'
+
+
+def export_onnx(tfidf, forest, label_encoder):
+    """Serialized ONNX graph of TF-IDF, forest and label decoding"""
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import StringTensorType
+    from sklearn.pipeline import Pipeline
+
+    tfidf = copy.copy(tfidf)
+    tfidf.lowercase = False
+    # The graph's labels are the severity names rather than encoded classes
+    decoded = copy.copy(forest)
+    decoded.classes_ = label_encoder.classes_[forest.classes_]
+
+    model = convert_sklearn(Pipeline([('tfidf', tfidf), ('forest', decoded)]),
+                            initial_types=[('text', StringTensorType([None, 1]))],
+                            options={id(decoded): {'zipmap': False}})
+    entry = model.metadata_props.add()
+    entry.key = CLASSES_METADATA_KEY
+    entry.value = json.dumps(np.asarray(forest.classes_).tolist())
+    return model.SerializeToString()
+
+
+def export_model_dir(model_dir):
+    """Write pipeline.onnx into a pre-bundle model directory"""
+    onnx_bytes = export_onnx(joblib.load(f'{model_dir}/tfidf_vectorizer.joblib'),
+                             joblib.load(f'{model_dir}/model.joblib'),
+                             joblib.load(f'{model_dir}/label_encoder.joblib'))
+    path = f'{model_dir}/{ONNX_FILE}'
+    with open(path, 'wb') as f:
+        f.write(onnx_bytes)
+    return path
+
+
+class OnnxPipeline:
+    def __init__(self, onnx_bytes, n_threads=None):
+        """onnxruntime session over an exported graph; n_threads=None keeps onnxruntime's default"""
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if n_threads is not None:
+            options.intra_op_num_threads = n_threads
+        self.n_threads = n_threads
+        self.session = onnxruntime.InferenceSession(onnx_bytes, options,
+                                                    providers=['CPUExecutionProvider'])
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.classes_ = np.asarray(json.loads(metadata[CLASSES_METADATA_KEY]))
+
+    def run(self, processed_texts):
+        """Predicted severity names and float32 probabilities for preprocessed texts"""
+        texts = np.asarray(processed_texts, dtype=object).reshape(-1, 1)
+        labels, probabilities = self.session.run(None, {'text': texts})
+        return labels, probabilities
+
+    def predict_proba(self, processed_texts):
+        """Class probabilities in classes_ order, as float64 like the other engines"""
+        if len(processed_texts) == 0:
+            return np.zeros((0, len(self.classes_)))
+        return self.run(processed_texts)[1].astype(np.float64)
+
+
+def check_parity(classifier, onnx_pipeline, processed_texts, atol=1e-5):
+    """Compare onnxruntime outputs with the sklearn TF-IDF and forest; returns mismatch counts
+
+    The graph computes in float32, so probabilities agree to about 1e-6
+    rather than exactly.
+    """
+    reference = classifier.model.predict_proba(classifier.tfidf.transform(processed_texts))
+    reference_labels = classifier.label_encoder.inverse_transform(
+        classifier.model.classes_[np.argmax(reference, axis=1)])
+    labels, probabilities = onnx_pipeline.run(processed_texts)
+
+    report = {
+        'rows': len(processed_texts),
+        'max_abs_proba_diff': float(np.abs(reference - probabilities).max()) if len(processed_texts) else 0.0,
+        'label_mismatches': int((labels != reference_labels).sum())
+    }
+    report['passed'] = report['max_abs_proba_diff'] <= atol and report['label_mismatches'] == 0
+    return report
+
+
+def compare_latency(classifier, onnx_pipeline, processed_texts, repeats=5):
+    """Time the sklearn path (TF-IDF transform + forest) and onnxruntime on one note and the batch"""
+    def best_of(fn):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def sklearn_proba(texts):
+        return classifier.model.predict_proba(classifier.tfidf.transform(texts))
+
+    single = processed_texts[:1]
+    return {
+        'sklearn_single_ms': best_of(lambda: sklearn_proba(single)) * 1000,
+        'onnx_single_ms': best_of(lambda: onnx_pipeline.predict_proba(single)) * 1000,
+        'sklearn_batch_ms': best_of(lambda: sklearn_proba(processed_texts)) * 1000,
+        'onnx_batch_ms': best_of(lambda: onnx_pipeline.predict_proba(processed_texts)) * 1000,
+        'batch_rows': len(processed_texts),
+        'onnx_threads': onnx_pipeline.n_threads or 'onnxruntime default'
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check ONNX parity and latency against the sklearn backend")
+    parser.add_argument('model', help="Model bundle, or a pre-bundle model directory to export into")
+    parser.add_argument('--texts', required=True, help="CSV of notes used for the parity and latency check")
+    parser.add_argument('--column', help="Text column (default: the first column)")
+    parser.add_argument('--threads', type=int, help="onnxruntime intra-op threads (default: all cores)")
+    args = parser.parse_args()
+
+    import pandas as pd
+    from medical_classifier import MedicalTextClassifier
+
+    from model_bundle import ModelDirectory
+
+    classifier = MedicalTextClassifier(args.model, cache_size=0)
+    source = classifier.source
+    if 'onnx_pipeline' in source:
+        onnx_bytes = source.load('onnx_pipeline')
+    elif isinstance(source, ModelDirectory):
+        print(f"Exported: {export_model_dir(args.model)}")
+        onnx_bytes = source.load('onnx_pipeline')
+    else:
+        # Bundles are not modified; the graph is exported for this check only
+        onnx_bytes = export_onnx(classifier.tfidf, classifier.model, classifier.label_encoder)
+        print("Exported the ONNX graph from the bundle's components")
+    onnx_pipeline = OnnxPipeline(onnx_bytes, args.threads)
+
+    df = pd.read_csv(args.texts)
+    texts = df[args.column or df.columns[0]].dropna().tolist()
+    processed = [classifier.preprocess_text(text) for text in texts]
+
+    print("\nParity against sklearn:")
+    for key, value in check_parity(classifier, onnx_pipeline, processed).items():
+        print(f"- {key}: {value}")
+
+    print("\nLatency comparison:")
+    for key, value in compare_latency(classifier, onnx_pipeline, processed).items():
+        print(f"- {key}: {value:.3f}" if isinstance(value, float) else f"- {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
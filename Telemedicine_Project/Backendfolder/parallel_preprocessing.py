@@ -0,0 +1,99 @@
+"""Parallel chunked preprocessing of the training corpus
+
+The distinct texts of a column are split into chunks and normalized by a
+pool of worker processes. Each worker builds its Preprocessor and WordNet
+lemmatizer once, in the pool initializer, and keeps them for every chunk
+it receives. Chunks come back in input order through imap. Each chunk
+also returns the lemmas the worker learned, so the parent's lemma table
+is complete for the model export.
+"""
+
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from chunking import iter_chunks
+from text_normalizer import Preprocessor
+
+# Distinct texts per task sent to a worker
+DEFAULT_CHUNK_SIZE = 2000
+
+_worker_preprocessor = None
+
+
+def _init_worker(stop_words, lemma_table):
+    global _worker_preprocessor
+    _worker_preprocessor = Preprocessor(stop_words, lemma_table)
+    _worker_preprocessor.warm_up()
+
+
+def _process_chunk(texts):
+    """Normalize one chunk; returns the texts and the lemmas added meanwhile"""
+    memo = _worker_preprocessor.lemma_memo
+    known = len(memo)
+    processed = [_worker_preprocessor.process_text(text) for text in texts]
+    # Dicts keep insertion order, so new lemmas are the tail of the memo
+    new_lemmas = dict(list(memo.items())[known:])
+    return processed, new_lemmas
+
+
+def print_progress(column, done, total, elapsed):
+    """Default progress report: texts done and throughput so far"""
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"{column}: {done}/{total} distinct texts ({done / total:.0%}), {rate:,.0f} texts/s")
+
+
+class ParallelPreprocessor:
+    def __init__(self, preprocessor=None, n_workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 on_progress=print_progress):
+        """Start a pool of n_workers processes (default: all cores)
+
+        Workers start from the stopwords and lemma memo of preprocessor,
+        and the lemmas they learn are merged back into it.
+        on_progress(column, done, total, elapsed) is called after every
+        chunk; pass None to silence it.
+        """
+        self.preprocessor = preprocessor or Preprocessor()
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+
+        # Spawned workers start clean instead of forking the notebook kernel
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(self.n_workers, initializer=_init_worker,
+                                 initargs=(self.preprocessor.stop_words,
+                                           self.preprocessor.lemma_table()))
+
+    def process_series(self, series):
+        """Normalize a pandas Series across the pool, keeping its order and index"""
+        codes, unique_texts = pd.factorize(series.to_numpy(dtype=object))
+        unique_texts = list(unique_texts)
+        total = len(unique_texts)
+        # Keep every worker busy even when the column is small
+        chunk_size = max(1, min(self.chunk_size, -(-total // self.n_workers)))
+
+        normalized = []
+        start = time.perf_counter()
+        for processed, new_lemmas in self.pool.imap(_process_chunk, iter_chunks(unique_texts, chunk_size)):
+            normalized.extend(processed)
+            self.preprocessor.load_lemma_table(new_lemmas)
+            if self.on_progress is not None:
+                self.on_progress(series.name, len(normalized), total, time.perf_counter() - start)
+
+        # Missing values get code -1, which picks the trailing empty string
+        normalized = np.array(normalized + [''], dtype=object)
+        return pd.Series(normalized[codes], index=series.index, name=series.name, dtype=object)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,150 @@
+"""Multi-core bulk scoring with a process pool sharing one model
+
+Notes are split into shards and scored by worker processes. Each worker
+loads the model once through the model registry with mmap_mode='r'.
+With the flat engine, every worker maps the same forest arrays (in the
+model bundle, or flat_forest.joblib of an older model directory), so
+the forest pages are shared and not copied into each process. Shard
+results are merged back in input order.
+
+get_parallel_scorer keeps one pool per model; asking for a different
+worker count closes the old pool and starts a new one. Once a model is
+released (the model watcher does this after a hot swap), no new pool
+is started for it: requests still holding it get their fallback scorer
+instead.
+"""
+
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+from chunking import iter_chunks
+from medical_classifier import MedicalTextClassifier
+from model_registry import default_engine, get_classifier
+
+# Notes per task sent to a worker
+DEFAULT_SHARD_SIZE = 500
+
+_worker_classifier = None
+
+_scorers = {}
+# Models whose scorers were released; no new pools are started for them
+_retired = set()
+_scorers_lock = threading.Lock()
+
+
+def _init_worker(model_dir, engine):
+    global _worker_classifier
+    _worker_classifier = get_classifier(model_dir, engine=engine, mmap_mode='r')
+
+
+def _score_shard(texts):
+    return _worker_classifier.predict_batch(texts)
+
+
+class ParallelScorer:
+    def __init__(self, model_dir, engine=None, n_workers=None, shard_size=DEFAULT_SHARD_SIZE):
+        """Start a pool of n_workers processes (default: all cores)"""
+        self.model_dir = model_dir
+        self.engine = engine or default_engine(model_dir)
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.shard_size = shard_size
+
+        # Spawned workers do not inherit the parent's threads or locks,
+        # which matters inside Streamlit's threaded server
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(self.n_workers, initializer=_init_worker,
+                                 initargs=(model_dir, self.engine))
+        self.closed = False
+        self._active = 0
+        self._idle = threading.Condition()
+        self._fallback = None
+
+    def predict_batch(self, texts):
+        """Score texts across the pool; same column-form result as MedicalTextClassifier
+
+        Once the scorer is closed, jobs still holding it score their
+        remaining batches in this process.
+        """
+        texts = list(texts)
+        with self._idle:
+            if self.closed:
+                if self._fallback is None:
+                    self._fallback = MedicalTextClassifier(self.model_dir, engine=self.engine, mmap_mode='r')
+                fallback = self._fallback
+            else:
+                fallback = None
+                self._active += 1
+        if fallback is not None:
+            return fallback.predict_batch(texts)
+
+        try:
+            # Keep every worker busy even when the input is small
+            shard_size = max(1, min(self.shard_size, -(-len(texts) // self.n_workers)))
+            shards = self.pool.map(_score_shard, list(iter_chunks(texts, shard_size)))
+        finally:
+            with self._idle:
+                self._active -= 1
+                self._idle.notify_all()
+
+        if not shards:
+            return {'predictions': np.array([]), 'probabilities': np.zeros((0, 0)),
+                    'classes': np.array([]), 'processed_texts': []}
+
+        return {
+            'predictions': np.concatenate([shard['predictions'] for shard in shards]),
+            'probabilities': np.vstack([shard['probabilities'] for shard in shards]),
+            'classes': shards[0]['classes'],
+            'processed_texts': [text for shard in shards for text in shard['processed_texts']]
+        }
+
+    def close(self):
+        """Stop the pool once the batches it is scoring have finished"""
+        with self._idle:
+            self.closed = True
+            self._idle.wait_for(lambda: self._active == 0)
+        self.pool.close()
+        self.pool.join()
+
+
+def get_parallel_scorer(model_dir, n_workers=None, engine=None, fallback=None):
+    """Return the process-wide scorer of a model, restarting its pool when n_workers changes
+
+    For a released model, fallback (typically the classifier the caller
+    already holds) is returned instead of starting a pool.
+    """
+    path = os.path.abspath(model_dir)
+    if path in _retired:
+        return fallback
+    engine = engine or default_engine(model_dir)
+    key = (path, engine)
+    n_workers = n_workers or os.cpu_count() or 1
+    with _scorers_lock:
+        # Checked again under the lock, as release may have run meanwhile
+        if path in _retired:
+            return fallback
+        previous = _scorers.get(key)
+        if previous is None or previous.n_workers != n_workers:
+            _scorers[key] = ParallelScorer(model_dir, engine=engine, n_workers=n_workers)
+        scorer = _scorers[key]
+    if previous is not None and previous is not scorer:
+        previous.close()
+    return scorer
+
+
+def release_parallel_scorers(model_dir):
+    """Close the scorers of a model, after the batches they are scoring, and start no new ones"""
+    path = os.path.abspath(model_dir)
+    with _scorers_lock:
+        _retired.add(path)
+        released = [_scorers.pop(key) for key in list(_scorers) if key[0] == path]
+    for scorer in released:
+        scorer.close()
+
+
+def reinstate_parallel_scorers(model_dir):
+    """Allow pools for a released model again, e.g. when it is promoted back"""
+    with _scorers_lock:
+        _retired.discard(os.path.abspath(model_dir))
@@ -0,0 +1,76 @@
+"""Bounded LRU cache of class probabilities for preprocessed notes"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(processed_text, model_version):
+    """Content address of a preprocessed note under one model version"""
+    digest = hashlib.sha256()
+    digest.update(model_version.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(processed_text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, max_size=10000, ttl_seconds=None):
+        """LRU cache holding at most max_size entries, optionally expiring them"""
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl_seconds is None or time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                # Expired entries count as evictions
+                del self._entries[key]
+                self.evictions += 1
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries if full"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove every entry; counters are kept"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Hit, miss and eviction counters plus the current size"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
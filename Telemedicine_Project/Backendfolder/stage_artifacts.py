@@ -0,0 +1,91 @@
+"""Columnar, content-hashed artifacts for the training stages
+
+Each stage output is a Parquet file named after the stage and a content
+hash. The hash covers:
+- the hashes of the stage's inputs (upstream artifact keys or source
+  file digests)
+- the stage parameters
+
+Unchanged inputs and parameters give the same key, so a stage whose
+artifact already exists can be loaded instead of recomputed. Parquet
+keeps the text columns typed and lets downstream stages read only the
+columns they use. Outputs that are not tables (fitted vectorizers,
+models, reports) are stored with joblib under the same naming scheme.
+"""
+
+import hashlib
+import json
+import os
+
+import joblib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ARTIFACTS_DIR = 'artifacts'
+
+# Hex digits of the content hash kept in artifact file names
+KEY_LENGTH = 16
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(inputs, params=None):
+    """Key of a stage output from its input keys and JSON-serializable parameters"""
+    payload = json.dumps({'inputs': list(inputs), 'params': params or {}},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:KEY_LENGTH]
+
+
+class ArtifactStore:
+    def __init__(self, root=ARTIFACTS_DIR):
+        """Parquet stage artifacts under root, one file per (stage, key)"""
+        self.root = root
+
+    def path(self, name, key, extension='parquet'):
+        return os.path.join(self.root, f'{name}-{key}.{extension}')
+
+    def exists(self, name, key):
+        return self.is_table(name, key) or os.path.exists(self.path(name, key, 'joblib'))
+
+    def is_table(self, name, key):
+        return os.path.exists(self.path(name, key))
+
+    def save(self, name, key, df):
+        """Write a stage output; the stage name and key go in the file metadata"""
+        os.makedirs(self.root, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata.update({b'mediscan.stage': name.encode('utf-8'),
+                         b'mediscan.key': key.encode('utf-8')})
+        table = table.replace_schema_metadata(metadata)
+
+        # Write beside the target and rename, so readers never see a partial file
+        path = self.path(name, key)
+        tmp_path = f'{path}.tmp'
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, name, key, columns=None):
+        """Read a stage output, optionally only some of its columns"""
+        return pd.read_parquet(self.path(name, key), columns=columns)
+
+    def save_object(self, name, key, obj):
+        """Write a non-tabular stage output with joblib"""
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(name, key, 'joblib')
+        tmp_path = f'{path}.tmp'
+        joblib.dump(obj, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def load_object(self, name, key, mmap_mode=None):
+        return joblib.load(self.path(name, key, 'joblib'), mmap_mode=mmap_mode)
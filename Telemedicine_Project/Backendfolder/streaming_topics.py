@@ -0,0 +1,221 @@
+"""Streaming minibatch topic modeling over on-disk corpora
+
+The feature stage fits LDA on the whole in-memory TF-IDF matrix. This
+mode reads the preprocessed notes from disk in chunks, so only one chunk
+of the corpus is in memory at a time:
+1. Vocabulary pass: per-chunk document and term frequencies are merged
+   into the same max_features/min_df/max_df vocabulary and smoothed IDF
+   weights that TfidfVectorizer would fit in memory.
+2. Training passes: each chunk is transformed and fed to
+   LatentDirichletAllocation.partial_fit. The model and its position
+   (epoch, chunk) are checkpointed every few chunks, so an interrupted
+   run resumes where it stopped.
+3. Topic pass: every chunk is transformed again and the dominant topic
+   of each note is streamed to a Parquet file. Empty notes get -1.
+
+Run with:
+    python streaming_topics.py artifacts/preprocessed-<key>.parquet --output topics.parquet
+"""
+
+import argparse
+import os
+
+import joblib
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.decomposition import LatentDirichletAllocation
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+from stage_artifacts import content_hash
+from streaming_training import DEFAULT_CHUNK_SIZE, iter_corpus_chunks
+from training_pipeline import FEATURE_PARAMS, TFIDF_PARAMS
+
+# Chunks between checkpoints, besides the one at the end of every epoch
+DEFAULT_CHECKPOINT_EVERY = 10
+
+
+def iter_text_chunks(path, column, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Chunks of the text column with missing values as empty strings"""
+    for texts in iter_corpus_chunks(path, column, chunk_size):
+        yield texts.where(texts.map(lambda text: isinstance(text, str)), '').to_numpy(dtype=object)
+
+
+def build_streaming_vectorizer(path, column, chunk_size=DEFAULT_CHUNK_SIZE,
+                               max_features=None, min_df=1, max_df=1.0):
+    """TfidfVectorizer with vocabulary and IDF computed in one streaming pass
+
+    Applies TfidfVectorizer's own pruning rules to the merged chunk
+    counts: document frequency bounds first, then the max_features
+    terms with the highest total counts. Returns the vectorizer and the
+    number of non-empty notes.
+    """
+    document_frequency, term_frequency = {}, {}
+    n_docs = 0
+    for texts in iter_text_chunks(path, column, chunk_size):
+        texts = texts[[len(text) > 0 for text in texts]]
+        if len(texts) == 0:
+            continue
+        n_docs += len(texts)
+        counter = CountVectorizer()
+        try:
+            counts = counter.fit_transform(texts)
+        except ValueError:
+            # Only stopwords or punctuation in this chunk
+            continue
+        chunk_df = np.asarray((counts > 0).sum(axis=0)).ravel()
+        chunk_tf = np.asarray(counts.sum(axis=0)).ravel()
+        for term, df, tf in zip(counter.get_feature_names_out(), chunk_df, chunk_tf):
+            document_frequency[term] = document_frequency.get(term, 0) + int(df)
+            term_frequency[term] = term_frequency.get(term, 0) + int(tf)
+
+    terms = np.array(sorted(document_frequency))
+    dfs = np.array([document_frequency[term] for term in terms])
+    tfs = np.array([term_frequency[term] for term in terms])
+
+    high = max_df if isinstance(max_df, int) else max_df * n_docs
+    low = min_df if isinstance(min_df, int) else min_df * n_docs
+    mask = (dfs <= high) & (dfs >= low)
+    if max_features is not None and mask.sum() > max_features:
+        keep = np.where(mask)[0][(-tfs[mask]).argsort()[:max_features]]
+        mask = np.zeros(len(terms), dtype=bool)
+        mask[keep] = True
+
+    vectorizer = TfidfVectorizer(vocabulary={term: i for i, term in enumerate(terms[mask])})
+    # Smoothed IDF, as TfidfVectorizer.fit computes it
+    vectorizer.idf_ = np.log((1 + n_docs) / (1 + dfs[mask])) + 1
+    return vectorizer, n_docs
+
+
+class StreamingTopicModel:
+    def __init__(self, path, column='processed_data', checkpoint_path=None,
+                 n_topics=FEATURE_PARAMS['n_topics'], lda_params=None, tfidf_params=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+        """Online LDA over the text column of a CSV or Parquet corpus
+
+        Defaults mirror the feature stage (FEATURE_PARAMS and TFIDF_PARAMS),
+        with one training pass per LDA max_iter. The checkpoint defaults
+        to <corpus>.lda_checkpoint.joblib.
+        """
+        self.path = path
+        self.column = column
+        self.checkpoint_path = checkpoint_path or f'{path}.lda_checkpoint.joblib'
+        self.n_topics = n_topics
+        self.lda_params = dict(lda_params or FEATURE_PARAMS['lda'])
+        self.n_epochs = self.lda_params.pop('max_iter')
+        self.tfidf_params = tfidf_params or TFIDF_PARAMS['tfidf']
+        self.chunk_size = chunk_size
+        self.checkpoint_every = checkpoint_every
+
+        self.vectorizer = None
+        self.lda = None
+        self.epoch = 0
+        self.chunks_done = 0
+
+    def _fingerprint(self):
+        """Identifies the corpus and settings a checkpoint belongs to"""
+        stat = os.stat(self.path)
+        return content_hash([os.path.abspath(self.path), stat.st_size, stat.st_mtime_ns],
+                            {'column': self.column, 'n_topics': self.n_topics,
+                             'lda': self.lda_params, 'epochs': self.n_epochs,
+                             'tfidf': self.tfidf_params, 'chunk_size': self.chunk_size})
+
+    def _save_checkpoint(self):
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        joblib.dump({
+            'fingerprint': self._fingerprint(),
+            'vectorizer': self.vectorizer,
+            'lda': self.lda,
+            'epoch': self.epoch,
+            'chunks_done': self.chunks_done
+        }, tmp_path)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _resume(self):
+        """Restore a checkpoint of this corpus and settings; returns whether one was found"""
+        if not os.path.exists(self.checkpoint_path):
+            return False
+        checkpoint = joblib.load(self.checkpoint_path)
+        if checkpoint['fingerprint'] != self._fingerprint():
+            print(f"Ignoring checkpoint {self.checkpoint_path}: corpus or settings changed")
+            return False
+        self.vectorizer = checkpoint['vectorizer']
+        self.lda = checkpoint['lda']
+        self.epoch = checkpoint['epoch']
+        self.chunks_done = checkpoint['chunks_done']
+        print(f"Resuming from epoch {self.epoch + 1}, chunk {self.chunks_done + 1}")
+        return True
+
+    def fit(self):
+        if not self._resume():
+            print("Building the vocabulary in a streaming pass...")
+            self.vectorizer, n_docs = build_streaming_vectorizer(
+                self.path, self.column, self.chunk_size, **self.tfidf_params)
+            print(f"{n_docs} notes, {len(self.vectorizer.vocabulary)} terms")
+            self.lda = LatentDirichletAllocation(n_components=self.n_topics, learning_method='online',
+                                                 total_samples=n_docs, **self.lda_params)
+            self._save_checkpoint()
+
+        while self.epoch < self.n_epochs:
+            for chunk_number, texts in enumerate(iter_text_chunks(self.path, self.column, self.chunk_size)):
+                if chunk_number < self.chunks_done:
+                    continue
+                texts = texts[[len(text) > 0 for text in texts]]
+                if len(texts):
+                    self.lda.partial_fit(self.vectorizer.transform(texts))
+                self.chunks_done = chunk_number + 1
+                if self.chunks_done % self.checkpoint_every == 0:
+                    self._save_checkpoint()
+
+            self.epoch += 1
+            self.chunks_done = 0
+            self._save_checkpoint()
+            print(f"Epoch {self.epoch}/{self.n_epochs} done")
+        return self
+
+    def write_dominant_topics(self, output_path):
+        """Stream each note's dominant topic (-1 for empty notes) to Parquet"""
+        schema = pa.schema([('row', pa.int64()), ('dominant_topic', pa.int16())])
+        row = 0
+        with pq.ParquetWriter(output_path, schema) as writer:
+            for texts in iter_text_chunks(self.path, self.column, self.chunk_size):
+                topics = np.full(len(texts), -1, dtype=np.int16)
+                non_empty = np.array([len(text) > 0 for text in texts], dtype=bool)
+                if non_empty.any():
+                    distribution = self.lda.transform(self.vectorizer.transform(texts[non_empty]))
+                    topics[non_empty] = np.argmax(distribution, axis=1)
+                rows = np.arange(row, row + len(texts), dtype=np.int64)
+                writer.write_table(pa.table({'row': rows, 'dominant_topic': topics}, schema=schema))
+                row += len(texts)
+        return output_path
+
+    def top_words(self, n_top_words=10):
+        feature_names = self.vectorizer.get_feature_names_out()
+        return [[feature_names[i] for i in topic.argsort()[:-n_top_words - 1:-1]]
+                for topic in self.lda.components_]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming minibatch LDA over an on-disk corpus")
+    parser.add_argument('corpus', help="CSV or Parquet file of preprocessed notes")
+    parser.add_argument('--column', default='processed_data')
+    parser.add_argument('--output', required=True, help="Parquet file for the dominant topic of every note")
+    parser.add_argument('--checkpoint', help="Checkpoint file (default: <corpus>.lda_checkpoint.joblib)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_EVERY)
+    parser.add_argument('--topics', type=int, default=FEATURE_PARAMS['n_topics'])
+    args = parser.parse_args()
+
+    model = StreamingTopicModel(args.corpus, args.column, args.checkpoint, args.topics,
+                                chunk_size=args.chunk_size, checkpoint_every=args.checkpoint_every)
+    model.fit()
+
+    print("\nTop words in each topic:")
+    for topic_idx, words in enumerate(model.top_words()):
+        print(f"Topic {topic_idx + 1}: {', '.join(words)}")
+
+    print(f"\nDominant topics saved to: {model.write_dominant_topics(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
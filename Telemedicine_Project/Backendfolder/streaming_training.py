@@ -0,0 +1,185 @@
+"""Out-of-core training with a hashing featurizer and partial_fit
+
+The in-memory pipeline fits a vocabulary-based TF-IDF and a random forest
+on the whole corpus, so the corpus has to fit in RAM. This mode streams
+the corpus from disk in chunks instead:
+- Notes are read chunk by chunk from a CSV or Parquet file, and
+  normalized per chunk unless they are already preprocessed.
+- A stateless HashingVectorizer turns each chunk into l2-normalized
+  term features, with nothing to fit.
+- An SGDClassifier with logistic loss learns from each chunk with
+  partial_fit, over one or more passes.
+- A stable hash of each note routes about 1 in holdout_mod notes to a
+  held-out split. Those notes are never trained on and are scored after
+  the last pass.
+
+Memory use is bounded by the chunk size and the fixed hashing width,
+so corpus size is limited by disk. The output is a regular model
+bundle (see model_bundle.py) that MedicalTextClassifier loads with the
+sklearn engine.
+
+Run with:
+    python streaming_training.py gpt-4.csv
+    python streaming_training.py artifacts/preprocessed-<key>.parquet --preprocessed
+"""
+
+import argparse
+import os
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import classification_report
+from sklearn.preprocessing import LabelEncoder
+
+from model_bundle import BUNDLE_EXTENSION, write_bundle
+from severity_labeler import SeverityLabeler
+from text_normalizer import Preprocessor
+from training_pipeline import MODELS_DIR
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# 2**18 hashed terms keeps collisions rare for a clinical vocabulary
+# while the three-class coefficient matrix stays around 6 MB
+DEFAULT_N_FEATURES = 2 ** 18
+
+SEVERITY_CLASSES = ['High', 'Low', 'Moderate']
+
+
+def iter_corpus_chunks(path, column, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield one text column of a CSV or Parquet file as Series of chunk_size rows"""
+    if path.endswith('.parquet'):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=[column]):
+            yield batch.column(0).to_pandas()
+    else:
+        for chunk in pd.read_csv(path, usecols=[column], chunksize=chunk_size):
+            yield chunk[column]
+
+
+def make_featurizer(n_features=DEFAULT_N_FEATURES):
+    """Stateless term features; transform needs no fitted vocabulary"""
+    return HashingVectorizer(n_features=n_features, alternate_sign=False, norm='l2')
+
+
+def is_holdout(texts, holdout_mod):
+    """Stable per-note split: the same note always lands on the same side"""
+    return np.fromiter((zlib.crc32(text.encode('utf-8')) % holdout_mod == 0 for text in texts),
+                       dtype=bool, count=len(texts))
+
+
+class StreamingTrainer:
+    def __init__(self, n_features=DEFAULT_N_FEATURES, preprocessed=False, holdout_mod=5,
+                 alpha=1e-5, random_state=42, labeler=None):
+        """Incremental severity classifier over a hashed feature space
+
+        With preprocessed=False every chunk is normalized with the same
+        Preprocessor, whose lemma table is exported with the model.
+        """
+        self.featurizer = make_featurizer(n_features)
+        self.preprocessor = None if preprocessed else Preprocessor()
+        self.labeler = labeler or SeverityLabeler()
+        self.holdout_mod = holdout_mod
+        self.label_encoder = LabelEncoder().fit(SEVERITY_CLASSES)
+        self.classes = self.label_encoder.transform(SEVERITY_CLASSES)
+        self.model = SGDClassifier(loss='log_loss', alpha=alpha, random_state=random_state)
+        self.trained_notes = 0
+
+    def _prepare(self, texts):
+        """Normalized non-empty notes of a chunk, their labels and holdout mask"""
+        if self.preprocessor is not None:
+            texts = self.preprocessor.process_series(texts)
+        texts = texts[texts.map(lambda text: isinstance(text, str) and len(text) > 0)]
+        y = self.label_encoder.transform(self.labeler.label_series(texts))
+        return texts, y, is_holdout(texts, self.holdout_mod)
+
+    def partial_fit(self, texts):
+        """Learn from one chunk of notes, skipping held-out ones"""
+        texts, y, holdout = self._prepare(texts)
+        train = ~holdout
+        if train.any():
+            self.model.partial_fit(self.featurizer.transform(texts[train]), y[train], classes=self.classes)
+            self.trained_notes += int(train.sum())
+
+    def fit(self, path, column, chunk_size=DEFAULT_CHUNK_SIZE, n_epochs=1):
+        for epoch in range(n_epochs):
+            for chunk_number, texts in enumerate(iter_corpus_chunks(path, column, chunk_size), 1):
+                self.partial_fit(texts)
+                print(f"Epoch {epoch + 1}/{n_epochs}, chunk {chunk_number}: "
+                      f"{self.trained_notes} notes trained on so far")
+        return self
+
+    def evaluate(self, path, column, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Classification report on the held-out notes, scored in one more streaming pass"""
+        y_true, y_pred = [], []
+        for texts in iter_corpus_chunks(path, column, chunk_size):
+            texts, y, holdout = self._prepare(texts)
+            if holdout.any():
+                y_true.append(y[holdout])
+                y_pred.append(self.model.predict(self.featurizer.transform(texts[holdout])))
+        if not y_true:
+            return None
+        return classification_report(np.concatenate(y_true), np.concatenate(y_pred),
+                                     labels=self.classes, target_names=SEVERITY_CLASSES,
+                                     zero_division=0)
+
+    def save(self, models_dir=MODELS_DIR):
+        """Write a versioned model bundle that MedicalTextClassifier can load"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        version = f'medical_classifier_{timestamp}'
+        os.makedirs(models_dir, exist_ok=True)
+        bundle_path = os.path.join(models_dir, f'{version}{BUNDLE_EXTENSION}')
+
+        components = {
+            'model': self.model,
+            'tfidf_vectorizer': self.featurizer,
+            'label_encoder': self.label_encoder,
+            'severity_rules': self.labeler.rules
+        }
+        if self.preprocessor is not None:
+            components['lemma_table'] = self.preprocessor.lemma_table()
+
+        write_bundle(bundle_path, components, {
+            'version': version,
+            'created_at': timestamp,
+            'model_type': type(self.model).__name__,
+            'classes': self.label_encoder.classes_.tolist(),
+            'n_features': self.featurizer.n_features,
+            'hashed_features': True,
+            'training_notes': self.trained_notes,
+            'severity_rules': {'version': self.labeler.version, 'fingerprint': self.labeler.fingerprint}
+        })
+        return bundle_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the severity classifier out of core")
+    parser.add_argument('corpus', help="CSV or Parquet file holding the notes")
+    parser.add_argument('--text-column',
+                        help="Column holding the notes (default: processed_data with --preprocessed, else data)")
+    parser.add_argument('--preprocessed', action='store_true',
+                        help="The text column is already normalized (e.g. a preprocessed stage artifact)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--n-features', type=int, default=DEFAULT_N_FEATURES)
+    parser.add_argument('--models-dir', default=MODELS_DIR)
+    args = parser.parse_args()
+    if args.text_column is None:
+        args.text_column = 'processed_data' if args.preprocessed else 'data'
+
+    trainer = StreamingTrainer(args.n_features, preprocessed=args.preprocessed)
+    trainer.fit(args.corpus, args.text_column, args.chunk_size, args.epochs)
+
+    report = trainer.evaluate(args.corpus, args.text_column, args.chunk_size)
+    if report is not None:
+        print("\nHeld-out Classification Report:")
+        print(report)
+
+    print(f"Model bundle saved in: {trainer.save(args.models_dir)}")
+
+
+if __name__ == "__main__":
+    main()
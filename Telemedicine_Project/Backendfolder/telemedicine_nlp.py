@@ -18,8 +18,6 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 import re
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
 import nltk
 
 # Download required NLTK data
@@ -27,54 +25,23 @@ nltk.download('stopwords')
 nltk.download('wordnet')
 nltk.download('omw-1.4')
 
-# Read the dataset
-print("Reading dataset...")
-df = pd.read_csv('/content/gpt-4.csv')
+from training_pipeline import TrainingPipeline
 
-def simple_tokenize(text):
-    """Simple tokenization by splitting on whitespace and punctuation"""
-    return re.findall(r'\b\w+\b', text.lower())
+# Preprocessing, features, labels, training, evaluation and export are
+# named pipeline stages (see training_pipeline.py). Each stage output is
+# a content-hashed artifact, so rerunning a cell only recomputes stages
+# whose inputs, parameters or code changed
+pipeline = TrainingPipeline('/content/gpt-4.csv')
 
-def preprocess_text(text):
-    """
-    Preprocess text while preserving meaningful content
-    """
-    if not isinstance(text, str):
-        return ''
-
-    # Convert to lowercase
-    text = text.lower()
-
-    # Simple tokenization
-    tokens = simple_tokenize(text)
-
-    # Remove stopwords but keep important ones
-    stop_words = set(stopwords.words('english'))
-    important_words = {'no', 'not', 'very', 'can', 'cannot', 'medical', 'doctor', 'patient'}
-    stop_words = stop_words - important_words
-    tokens = [token for token in tokens if token not in stop_words]
-
-    # Lemmatization
-    lemmatizer = WordNetLemmatizer()
-    tokens = [lemmatizer.lemmatize(token) for token in tokens]
-
-    # Join tokens back together
-    processed_text = ' '.join(tokens)
-
-    # Remove extra whitespace
-    processed_text = ' '.join(processed_text.split())
-
-    return processed_text
+# Normalize the data and conversation columns on every core
+print("Processing text data...")
+pipeline.run('preprocess')
+df = pipeline.load('preprocessed')
 
 # Print example of original text
 print("\nExample of original text:")
 print(df['data'].iloc[0][:200], "...")
 
-# Process the data
-print("\nProcessing text data...")
-df['processed_data'] = df['data'].apply(preprocess_text)
-df['processed_conversation'] = df['conversation'].apply(preprocess_text)
-
 # Print example of processed text
 print("\nExample of processed text:")
 print(df['processed_data'].iloc[0][:200], "...")
@@ -91,10 +58,6 @@ print("\nNumber of empty strings:")
 print("Data column:", (df['processed_data'] == '').sum())
 print("Conversation column:", (df['processed_conversation'] == '').sum())
 
-# Save the preprocessed data
-df.to_csv('preprocessed_gpt4.csv', index=False)
-print("\nPreprocessed data saved to 'preprocessed_gpt4.csv'")
-
 # Display sample rows to verify preprocessing
 print("\nFirst few rows of processed data:")
 print(df[['processed_data', 'processed_conversation']].head(2))
@@ -247,81 +210,8 @@ if name == "main":
 
 import pandas as pd
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
-from sklearn.decomposition import LatentDirichletAllocation, TruncatedSVD
-from collections import Counter
 import matplotlib.pyplot as plt
 import seaborn as sns
-from textblob import TextBlob
-
-# Read the preprocessed data
-df = pd.read_csv('preprocessed_gpt4.csv')
-
-def clean_text_for_analysis(text):
-    """Convert any non-string values to empty string"""
-    if pd.isna(text) or not isinstance(text, str):
-        return ''
-    return text
-
-def analyze_sentiment(text):
-    """Analyze sentiment of text with proper error handling"""
-    try:
-        if pd.isna(text) or not isinstance(text, str):
-            return 0
-        return TextBlob(str(text)).sentiment.polarity
-    except:
-        return 0
-
-def extract_features():
-    print("Extracting features from text...")
-
-    # Clean the text data
-    df['processed_data'] = df['processed_data'].apply(clean_text_for_analysis)
-    df['processed_conversation'] = df['processed_conversation'].apply(clean_text_for_analysis)
-
-    # Remove any rows where processed text is empty
-    print(f"Initial shape: {df.shape}")
-    df_cleaned = df[df['processed_data'].str.len() > 0].copy()
-    print(f"Shape after removing empty texts: {df_cleaned.shape}")
-
-    # Add sentiment analysis
-    print("Performing sentiment analysis...")
-    df_cleaned['data_sentiment'] = df_cleaned['data'].apply(analyze_sentiment)
-    df_cleaned['conversation_sentiment'] = df_cleaned['conversation'].apply(analyze_sentiment)
-
-    # Create TF-IDF features with adjusted parameters
-    print("Creating TF-IDF features...")
-    tfidf = TfidfVectorizer(max_features=1000,
-                           stop_words=None,  # We've already removed stopwords
-                           min_df=5,  # Increased minimum document frequency
-                           max_df=0.9)  # Decreased maximum document frequency
-
-    data_tfidf = tfidf.fit_transform(df_cleaned['processed_data'])
-
-    # Get top terms
-    feature_names = tfidf.get_feature_names_out()
-    top_terms = pd.DataFrame(data_tfidf.sum(axis=0).T,
-                           index=feature_names,
-                           columns=['weight']).sort_values('weight', ascending=False)
-
-    return df_cleaned, data_tfidf, top_terms
-
-def perform_topic_modeling(data_tfidf, n_topics=5):
-    print(f"\nPerforming topic modeling with {n_topics} topics...")
-
-    # LDA Topic Modeling with adjusted parameters
-    lda = LatentDirichletAllocation(n_components=n_topics,
-                                   random_state=42,
-                                   max_iter=20,  # Increased iterations
-                                   learning_method='online',
-                                   learning_offset=50.,
-                                   batch_size=128)
-    lda_output = lda.fit_transform(data_tfidf)
-
-    # Get dominant topics
-    dominant_topics = np.argmax(lda_output, axis=1)
-
-    return lda, lda_output, dominant_topics
 
 def visualize_results(top_terms, df_cleaned):
     print("\nCreating visualizations...")
@@ -360,117 +250,44 @@ def analyze_topics(lda, feature_names, n_top_words=10):
         print(f"\nTopic {topic_idx + 1}:")
         print(", ".join(top_words))
 
-# Main execution
+# Sentiment, TF-IDF and LDA topics
 print("Starting analysis...")
-enhanced_df, tfidf_matrix, topic_distribution = main()
+pipeline.run('features')
+enhanced_df = pipeline.load('enhanced')
+top_terms = pipeline.load('top_terms').set_index('term')
+topic_model = pipeline.load('topic_model')
 
-"""Building the random forest model and saving it"""
+# Agreement of the vectorized sentiment scores with per-row TextBlob
+for column, report in pipeline.load('sentiment_parity').items():
+    print(f"\nSentiment parity vs TextBlob ({column}):")
+    for metric, value in report.items():
+        print(f"- {metric}: {value}")
 
+# Visualize results
+visualize_results(top_terms, enhanced_df)
+
+# Analyze topics
+analyze_topics(topic_model['lda'], topic_model['feature_names'])
+
+"""Building the random forest model and saving it"""
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report, confusion_matrix
 import matplotlib.pyplot as plt
 import seaborn as sns
-from sklearn.preprocessing import LabelEncoder
-
-# Read the enhanced dataset
-print("Loading enhanced dataset...")
-df = pd.read_csv('enhanced_gpt4.csv')
-
-def create_severity_labels(text):
-    """Create severity labels based on text content"""
-    text = text.lower()
-    if any(word in text for word in ['severe', 'critical', 'emergency', 'urgent', 'icu']):
-        return 'High'
-    elif any(word in text for word in ['moderate', 'mild', 'stable']):
-        return 'Moderate'
-    else:
-        return 'Low'
-
-def prepare_data():
-    print("Preparing data for classification...")
-
-    # Create severity labels
-    df['severity'] = df['processed_data'].apply(create_severity_labels)
-
-    # Print class distribution
-    print("\nClass distribution:")
-    print(df['severity'].value_counts(normalize=True))
-
-    # Split features and target
-    X = df['processed_data']
-    y = df['severity']
-
-    # Encode labels
-    le = LabelEncoder()
-    y_encoded = le.fit_transform(y)
-
-    # Split the data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y_encoded, test_size=0.2, random_state=42, stratify=y_encoded
-    )
-
-    # Create TF-IDF features
-    tfidf = TfidfVectorizer(max_features=1000, min_df=5, max_df=0.9)
-    X_train_tfidf = tfidf.fit_transform(X_train)
-    X_test_tfidf = tfidf.transform(X_test)
-
-    return X_train_tfidf, X_test_tfidf, y_train, y_test, le, tfidf
-
-def train_model(X_train, y_train):
-    print("\nTraining Random Forest model...")
-
-    # Initialize and train the model
-    rf = RandomForestClassifier(n_estimators=100,
-                              max_depth=20,
-                              min_samples_split=5,
-                              random_state=42,
-                              n_jobs=-1)
-    rf.fit(X_train, y_train)
-
-    return rf
-
-def evaluate_model(model, X_test, y_test, label_encoder):
-    print("\nEvaluating model performance...")
-
-    # Make predictions
-    y_pred = model.predict(X_test)
-
-    # Print classification report
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred,
-                              target_names=label_encoder.classes_))
-
-    # Create confusion matrix
-    cm = confusion_matrix(y_test, y_pred)
 
+def plot_confusion_matrix(evaluation):
     # Plot confusion matrix
     plt.figure(figsize=(10, 8))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
-                xticklabels=label_encoder.classes_,
-                yticklabels=label_encoder.classes_)
+    sns.heatmap(evaluation['confusion_matrix'], annot=True, fmt='d', cmap='Blues',
+                xticklabels=evaluation['classes'],
+                yticklabels=evaluation['classes'])
     plt.title('Confusion Matrix')
     plt.xlabel('Predicted')
     plt.ylabel('True')
     plt.tight_layout()
     plt.show()
 
-def analyze_feature_importance(model, tfidf):
-    print("\nAnalyzing feature importance...")
-
-    # Get feature importance
-    feature_importance = pd.DataFrame({
-        'feature': tfidf.get_feature_names_out(),
-        'importance': model.feature_importances_
-    })
-
-    # Sort by importance
-    feature_importance = feature_importance.sort_values('importance',
-                                                      ascending=False)
-
+def plot_feature_importance(feature_importance):
     # Plot top 20 features
     plt.figure(figsize=(12, 6))
     sns.barplot(data=feature_importance.head(20),
@@ -480,38 +297,29 @@ def analyze_feature_importance(model, tfidf):
     plt.tight_layout()
     plt.show()
 
-    return feature_importance
-
-def main():
-    # Prepare data
-    X_train, X_test, y_train, y_test, label_encoder, tfidf = prepare_data()
-
-    # Train model
-    model = train_model(X_train, y_train)
-
-    # Evaluate model
-    evaluate_model(model, X_test, y_test, label_encoder)
-
-    # Analyze feature importance
-    feature_importance = analyze_feature_importance(model, tfidf)
-
-    # Save the model results
-    results = {
-        'model': model,
-        'label_encoder': label_encoder,
-        'tfidf': tfidf,
-        'feature_importance': feature_importance
-    }
-
-    return results
-
-# Run the analysis
-results = main()
-
-# Print available variables
-import sys
-variables = [var for var in dir() if not var.startswith('_')]
-print("Available variables:", variables)
+# Label, train and evaluate; unchanged stages are loaded from their artifacts
+pipeline.run('evaluate')
+trained = pipeline.load('trained')
+evaluation = pipeline.load('evaluation')
+feature_importance = pipeline.load('feature_importance')
+
+print("\nClassification Report:")
+print(evaluation['report'])
+plot_confusion_matrix(evaluation)
+plot_feature_importance(feature_importance)
+
+# Linear fast tier: how often the forest fallback fires at each margin threshold
+pipeline.run('fast_tier')
+print("\nCascade trade-off on the held-out split:")
+print(pipeline.load('cascade_tradeoff').to_string(index=False))
+
+# Save the model results
+results = {
+    'model': trained['model'],
+    'label_encoder': trained['label_encoder'],
+    'tfidf': trained['tfidf'],
+    'feature_importance': feature_importance.set_index('feature')
+}
 
 # Check what's in the results variable
 print("Type of results:", type(results))
@@ -519,144 +327,39 @@ print("\nContents of results:")
 for key in results.keys():
     print(f"- {key}")
 
-# Check if we have the required components
-if 'label_encoder' in locals():
-    print("Label encoder is available")
-if 'tfidf' in locals():
-    print("TF-IDF vectorizer is available")
-
-import joblib
-import os
-from datetime import datetime
-import shutil
-
-# Create directory for models if it doesn't exist
-if not os.path.exists('models'):
-    os.makedirs('models')
-
-# Get timestamp for unique model name
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-model_dir = f'models/medical_classifier_{timestamp}'
-os.makedirs(model_dir)
-
-# Save all components from the results dictionary
-model_path = os.path.join(model_dir, 'model.joblib')
-tfidf_path = os.path.join(model_dir, 'tfidf_vectorizer.joblib')
-encoder_path = os.path.join(model_dir, 'label_encoder.joblib')
-importance_path = os.path.join(model_dir, 'feature_importance.joblib')
-
-# Save the components
-joblib.dump(results['model'], model_path)
-joblib.dump(results['tfidf'], tfidf_path)
-joblib.dump(results['label_encoder'], encoder_path)
-joblib.dump(results['feature_importance'], importance_path)
-
-# Save feature importance as CSV for easy viewing
-results['feature_importance'].to_csv(os.path.join(model_dir, 'feature_importance.csv'))
-
-print(f"Model and components saved in: {model_dir}")
-
-# Create info file
-info_path = os.path.join(model_dir, 'model_info.txt')
-with open(info_path, 'w') as f:
-    f.write(f"Model type: {type(results['model']).__name__}\n")
-    f.write(f"Created at: {timestamp}\n")
-    f.write(f"Number of features: {len(results['feature_importance'])}\n")
-    f.write(f"Classes: {list(results['label_encoder'].classes_)}\n")
-
-print("\nSaved files:")
-print(f"- Model: {model_path}")
-print(f"- TF-IDF vectorizer: {tfidf_path}")
-print(f"- Label encoder: {encoder_path}")
-print(f"- Feature importance: {importance_path}")
-print(f"- Feature importance CSV: {os.path.join(model_dir, 'feature_importance.csv')}")
-print(f"- Model info: {info_path}")
-
-# Create a zip file of the model directory
-zip_path = f'{model_dir}.zip'
-shutil.make_archive(model_dir, 'zip', model_dir)
-print(f"\nCreated zip archive: {zip_path}")
-
-# Quick verification
-print("\nVerifying saved files...")
-try:
-    # Try to load back the model to verify it was saved correctly
-    loaded_model = joblib.load(model_path)
-    loaded_tfidf = joblib.load(tfidf_path)
-    loaded_encoder = joblib.load(encoder_path)
-    print("✓ All components loaded successfully!")
-except Exception as e:
-    print(f"Error during verification: {e}")
+from model_bundle import ModelBundle
 
-import joblib
-import pandas as pd
-import re
-
-class MedicalTextClassifier:
-    def __init__(self, model_dir):
-        """Initialize the classifier with saved model components"""
-        # Load the saved components
-        self.model = joblib.load(f'{model_dir}/model.joblib')
-        self.tfidf = joblib.load(f'{model_dir}/tfidf_vectorizer.joblib')
-        self.label_encoder = joblib.load(f'{model_dir}/label_encoder.joblib')
-
-        # Print loaded model info
-        print("Model loaded successfully!")
-        print(f"Available classes: {self.label_encoder.classes_}")
-
-    def preprocess_text(self, text):
-        """Preprocess the input text"""
-        if not isinstance(text, str):
-            return ''
-
-        # Convert to lowercase
-        text = text.lower()
-
-        # Remove special characters but keep important punctuation
-        text = re.sub(r'[^a-zA-Z\s.,!?]', ' ', text)
-
-        # Remove extra whitespace
-        text = ' '.join(text.split())
+# Write the versioned model bundle; only reruns when the trained model,
+# the lemma table or the severity rules changed
+pipeline.run('export')
+bundle_path = pipeline.load('export')['bundle_path']
 
-        return text
+bundle = ModelBundle(bundle_path)
+print(f"\nModel bundle: {bundle_path}")
+print(f"Version: {bundle.version}")
+print(f"Classes: {bundle.classes}")
+print(f"Number of features: {bundle.n_features}")
+print("Components:")
+for name, entry in bundle.manifest['components'].items():
+    print(f"- {name} ({entry['bytes']:,} bytes)")
 
-    def predict_single(self, text):
-        """Make prediction for a single text input"""
-        # Preprocess the text
-        processed_text = self.preprocess_text(text)
-
-        # Transform text using the saved TF-IDF vectorizer
-        text_tfidf = self.tfidf.transform([processed_text])
-
-        # Make prediction
-        prediction_encoded = self.model.predict(text_tfidf)
-        prediction_proba = self.model.predict_proba(text_tfidf)
-
-        # Decode the prediction
-        prediction = self.label_encoder.inverse_transform(prediction_encoded)
-
-        # Get confidence scores
-        class_probabilities = dict(zip(self.label_encoder.classes_,
-                                     prediction_proba[0]))
-
-        return {
-            'prediction': prediction[0],
-            'confidence_scores': class_probabilities,
-            'processed_text': processed_text
-        }
+# Quick verification against the manifest checksums, without unpickling
+print("\nVerifying bundle checksums...")
+try:
+    bundle.verify()
+    print("✓ All components match the manifest!")
+except ValueError as e:
+    print(f"Error during verification: {e}")
 
-    def predict_batch(self, texts):
-        """Make predictions for a batch of texts"""
-        results = []
-        for text in texts:
-            results.append(self.predict_single(text))
-        return results
+from medical_classifier import MedicalTextClassifier
 
 # Example usage
 def main():
     # Initialize the classifier with your saved model directory
     model_dir = '/content/models/medical_classifier_20250123_152858'  # Replace with your model's timestamp
     classifier = MedicalTextClassifier(model_dir)
+    print("Model loaded successfully!")
+    print(f"Available classes: {classifier.label_encoder.classes_}")
 
     # Example single prediction
     sample_text = """
@@ -681,11 +384,12 @@ def main():
     print("\nMaking batch predictions:")
     results = classifier.predict_batch(sample_texts)
 
-    for i, result in enumerate(results, 1):
+    for i, (prediction, probabilities) in enumerate(zip(results['predictions'],
+                                                        results['probabilities']), 1):
         print(f"\nText {i}:")
-        print(f"Prediction: {result['prediction']}")
+        print(f"Prediction: {prediction}")
         print("Confidence Scores:")
-        for class_name, probability in result['confidence_scores'].items():
+        for class_name, probability in zip(results['classes'], probabilities):
             print(f"{class_name}: {probability:.2%}")
 
 if __name__ == "__main__":
@@ -0,0 +1,229 @@
+"""Text normalizer shared by training and serving
+
+Both the training corpus and notes scored at request time go through
+normalize_text, so the TF-IDF vectorizer sees the same token stream in
+both places. The pipeline matches the original training preprocess_text
+step for step:
+- lowercase
+- word tokens (\\b\\w+\\b)
+- English stopwords removed, keeping the clinically important ones
+- WordNet noun lemmas
+
+It runs faster because:
+- Character filtering uses a precomputed str.translate table, falling
+  back to the regex only for non-ASCII text.
+- The stopword set and the WordNet lemmatizer are built once per
+  Preprocessor, not once per text.
+- Lemmas are memoized per token, so WordNet is asked once per
+  vocabulary word. Training memoizes every token, since the memo is
+  exported as the lemma table. Serving Preprocessors keep only the
+  memo_size most recently used tokens beyond that table, so notes
+  scored by a long-running service do not grow the memo without bound.
+- Preprocessor.process_series normalizes each distinct text of a pandas
+  Series once and maps the results back.
+
+The module-level normalize_text, normalize_series, lemma_table and
+load_lemma_table functions use one shared default_preprocessor.
+"""
+
+import functools
+import re
+import string
+import warnings
+
+import numpy as np
+import pandas as pd
+
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+# Every ASCII character that cannot be part of a \w token becomes a space
+_WORD_CHARS = set(string.ascii_letters + string.digits + '_')
+TRANSLATION_TABLE = str.maketrans({chr(code): ' ' for code in range(128)
+                                   if chr(code) not in _WORD_CHARS})
+
+# NLTK's English stopword list, frozen so training and serving agree
+# regardless of the installed corpus version
+NLTK_ENGLISH_STOPWORDS = frozenset("""
+i me my myself we our ours ourselves you you're you've you'll you'd your yours
+yourself yourselves he him his himself she she's her hers herself it it's its
+itself they them their theirs themselves what which who whom this that that'll
+these those am is are was were be been being have has had having do does did
+doing a an the and but if or because as until while of at by for with about
+against between into through during before after above below to from up down
+in out on off over under again further then once here there when where why how
+all any both each few more most other some such no nor not only own same so
+than too very s t can will just don don't should should've now d ll m o re ve y
+ain aren aren't couldn couldn't didn didn't doesn doesn't hadn hadn't hasn
+hasn't haven haven't isn isn't ma mightn mightn't mustn mustn't needn needn't
+shan shan't shouldn shouldn't wasn wasn't weren weren't won won't wouldn
+wouldn't
+""".split())
+
+IMPORTANT_WORDS = frozenset({'no', 'not', 'very', 'can', 'cannot', 'medical', 'doctor', 'patient'})
+
+STOP_WORDS = NLTK_ENGLISH_STOPWORDS - IMPORTANT_WORDS
+
+LEMMA_TABLE_FILE = 'lemma_table.joblib'
+
+# Tokens outside the lemma table memoized by a serving Preprocessor
+SERVING_MEMO_SIZE = 10000
+
+
+def _load_wordnet_lemmatizer():
+    """WordNet noun lemmatizer, or str when the WordNet corpus is missing"""
+    try:
+        from nltk.stem import WordNetLemmatizer
+        lemmatize = WordNetLemmatizer().lemmatize
+        lemmatize('cases')
+        return lemmatize
+    except (ImportError, LookupError):
+        warnings.warn("WordNet corpus not found; tokens missing from the lemma "
+                      "table are left unlemmatized. Run nltk.download('wordnet').")
+        return str
+
+
+def tokenize(text):
+    """Lowercased \\b\\w+\\b tokens of a text"""
+    text = text.lower()
+    if text.isascii():
+        return text.translate(TRANSLATION_TABLE).split()
+    return WORD_PATTERN.findall(text)
+
+
+class Preprocessor:
+    def __init__(self, stop_words=STOP_WORDS, lemma_table=None, memo_size=None):
+        """Stateful normalizer holding the stopword set, lemmatizer and lemma memo
+
+        The stopword set is built once per instance. The WordNet lemmatizer
+        is built on the first token missing from the memo, so a Preprocessor
+        seeded with an exported lemma table never needs the corpus.
+        memo_size=None adds every new token to the memo (and so to
+        lemma_table()); otherwise new tokens go to an LRU of memo_size
+        entries and the memo stays the seeded table.
+        """
+        self.stop_words = frozenset(stop_words)
+        self.lemma_memo = dict(lemma_table or {})
+        self.memo_size = memo_size
+        self._lemmatizer = None
+        self._recent_lemma = (functools.lru_cache(maxsize=memo_size)(self._wordnet_lemma)
+                              if memo_size is not None else None)
+
+    def warm_up(self):
+        """Build the WordNet lemmatizer now rather than on the first memo miss"""
+        if self._lemmatizer is None:
+            self._lemmatizer = _load_wordnet_lemmatizer()
+
+    def _wordnet_lemma(self, token):
+        self.warm_up()
+        return self._lemmatizer(token)
+
+    def lemmatize(self, token):
+        """Memoized WordNet noun lemma of a token"""
+        lemma = self.lemma_memo.get(token)
+        if lemma is None:
+            if self._recent_lemma is not None:
+                return self._recent_lemma(token)
+            lemma = self.lemma_memo[token] = self._wordnet_lemma(token)
+        return lemma
+
+    def process_text(self, text):
+        """Normalize one text into the space-joined token stream"""
+        if not isinstance(text, str):
+            return ''
+        stop_words = self.stop_words
+        return ' '.join([self.lemmatize(token) for token in tokenize(text) if token not in stop_words])
+
+    def process_series(self, series):
+        """Normalize a pandas Series of texts, each distinct text once"""
+        codes, unique_texts = pd.factorize(series.to_numpy(dtype=object))
+        # Missing values get code -1, which picks the trailing empty string
+        normalized = np.array([self.process_text(text) for text in unique_texts] + [''], dtype=object)
+        return pd.Series(normalized[codes], index=series.index, name=series.name, dtype=object)
+
+    def lemma_table(self):
+        """Copy of the token-to-lemma memo, for export with a model"""
+        return dict(self.lemma_memo)
+
+    def load_lemma_table(self, table):
+        """Seed the memo so known tokens resolve without WordNet"""
+        self.lemma_memo.update(table)
+
+
+# Process-wide instance behind the module-level functions used by serving
+default_preprocessor = Preprocessor(memo_size=SERVING_MEMO_SIZE)
+
+lemmatize = default_preprocessor.lemmatize
+normalize_text = default_preprocessor.process_text
+normalize_series = default_preprocessor.process_series
+lemma_table = default_preprocessor.lemma_table
+load_lemma_table = default_preprocessor.load_lemma_table
+
+# Kept for backward compatibility with the training notebook
+preprocess_text = normalize_text
+
+
+def simple_tokenize(text):
+    """Simple tokenization by splitting on whitespace and punctuation"""
+    return re.findall(r'\b\w+\b', text.lower())
+
+
+def reference_preprocess_text(text):
+    """The original per-row training implementation, kept for parity checks"""
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+
+    if not isinstance(text, str):
+        return ''
+    text = text.lower()
+    tokens = simple_tokenize(text)
+    stop_words = set(stopwords.words('english'))
+    important_words = {'no', 'not', 'very', 'can', 'cannot', 'medical', 'doctor', 'patient'}
+    stop_words = stop_words - important_words
+    tokens = [token for token in tokens if token not in stop_words]
+    lemmatizer = WordNetLemmatizer()
+    tokens = [lemmatizer.lemmatize(token) for token in tokens]
+    return ' '.join(' '.join(tokens).split())
+
+
+def check_parity(texts):
+    """Compare normalize_text, normalize_series and the reference implementation
+
+    Returns the number of texts and the mismatches found; the reference
+    needs the NLTK stopwords and WordNet corpora.
+    """
+    texts = list(texts)
+    fast = [normalize_text(text) for text in texts]
+    batched = normalize_series(pd.Series(texts, dtype=object)).tolist()
+    reference = [reference_preprocess_text(text) for text in texts]
+
+    return {
+        'texts': len(texts),
+        'fast_vs_reference_mismatches': sum(a != b for a, b in zip(fast, reference)),
+        'series_vs_fast_mismatches': sum(a != b for a, b in zip(batched, fast)),
+        'stopword_list_matches_nltk': _installed_stopwords() == NLTK_ENGLISH_STOPWORDS
+    }
+
+
+def _installed_stopwords():
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check normalizer parity against the reference implementation")
+    parser.add_argument('csv', help="CSV file holding the texts")
+    parser.add_argument('--column', help="Text column (default: the first column)")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    texts = df[args.column] if args.column else df.iloc[:, 0]
+
+    print("Normalizer parity:")
+    for key, value in check_parity(texts).items():
+        print(f"- {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,552 @@
+"""Incremental training pipeline for the severity classifier
+
+The training flow is a chain of named stages, each declaring the artifacts
+it reads (and which columns of them), the artifacts it writes and its
+parameters:
+
+    preprocess -> featurize -> features -> labels -> train -> evaluate
+                                                         \\-> fast_tier -> export
+
+The featurize stage fits the corpus TF-IDF once; features (top terms and
+topics) and train both read its matrix rather than fitting their own.
+
+A stage's key hashes the keys of the stages it reads from, its parameters,
+the source of its function and of the functions in this module it
+calls, and the source of the helper modules it uses (see
+stage_artifacts.py). Running a stage
+first brings its upstream stages up to date, and a stage whose outputs
+already exist under its current key is loaded instead of rerun. Changing
+the forest settings therefore retrains and re-exports the model without
+redoing preprocessing, the TF-IDF fit or LDA.
+
+Run with:
+    python training_pipeline.py gpt-4.csv              # whole pipeline
+    python training_pipeline.py gpt-4.csv --stage train
+    python training_pipeline.py gpt-4.csv --status
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from severity_labeler import DEFAULT_RULES, SeverityLabeler, default_labeler
+from stage_artifacts import ArtifactStore, content_hash, file_digest
+from text_normalizer import STOP_WORDS, Preprocessor
+
+SOURCE = 'source'
+
+MODELS_DIR = 'models'
+
+
+class Stage:
+    def __init__(self, name, fn, inputs, outputs, params=None, helpers=()):
+        """A named step of the pipeline
+
+        inputs maps each artifact read to the columns needed (None for a
+        whole table, or for non-tabular artifacts). fn(pipeline, inputs,
+        params) receives the loaded inputs and returns a dict with one
+        value per name in outputs: DataFrames are stored as Parquet,
+        anything else with joblib. helpers names the modules whose code
+        shapes the outputs.
+        """
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+        self.helpers = helpers
+
+    def functions(self):
+        """The stage function and the functions of its module it calls, directly or not"""
+        module = inspect.getmodule(self.fn)
+        found = []
+        pending = [self.fn]
+        while pending:
+            fn = pending.pop()
+            if fn in found:
+                continue
+            found.append(fn)
+            # Names used by the function and by its lambdas and comprehensions
+            codes = [fn.__code__]
+            while codes:
+                code = codes.pop()
+                codes.extend(const for const in code.co_consts if inspect.iscode(const))
+                for name in code.co_names:
+                    value = getattr(module, name, None)
+                    if inspect.isfunction(value) and value.__module__ == module.__name__:
+                        pending.append(value)
+        return found
+
+    def code_digest(self):
+        """Hash of the source of the stage's functions and helper modules, so editing either invalidates the stage"""
+        digest = hashlib.sha256()
+        for fn in sorted(self.functions(), key=lambda fn: fn.__name__):
+            digest.update(inspect.getsource(fn).encode('utf-8'))
+        for module in self.helpers:
+            # Hashed from the file, without importing the module
+            digest.update(file_digest(importlib.util.find_spec(module).origin).encode('ascii'))
+        return digest.hexdigest()
+
+
+def preprocess(pipeline, inputs, params):
+    """Normalize the data and conversation columns in parallel"""
+    from parallel_preprocessing import ParallelPreprocessor
+
+    df = inputs[SOURCE]
+    preprocessor = Preprocessor(params['stop_words'])
+    with ParallelPreprocessor(preprocessor, n_workers=pipeline.n_workers) as parallel_preprocessor:
+        df['processed_data'] = parallel_preprocessor.process_series(df['data'])
+        df['processed_conversation'] = parallel_preprocessor.process_series(df['conversation'])
+
+    # The export stage ships these lemmas with the model
+    lemmas = preprocessor.lemma_table()
+    return {
+        'preprocessed': df,
+        'lemma_table': pd.DataFrame({'token': list(lemmas), 'lemma': list(lemmas.values())})
+    }
+
+
+def _clean_text(series):
+    """Convert any non-string values to empty string"""
+    return series.where(series.map(lambda text: isinstance(text, str)), '')
+
+
+def featurize(pipeline, inputs, params):
+    """Fit the corpus TF-IDF once for top terms, topics and classifier training
+
+    Rows whose processed text is empty are dropped. The output keeps the
+    fitted vectorizer, the sparse matrix and the positions of the kept
+    rows in the preprocessed table; downstream tables follow that order.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    processed = _clean_text(inputs['preprocessed']['processed_data'])
+    rows = np.flatnonzero(processed.str.len().to_numpy() > 0)
+    print(f"Removed {len(processed) - len(rows)} rows with empty processed text")
+
+    # Stopwords were already removed; min_df=5 and max_df=0.9 tighten the vocabulary
+    print("Creating TF-IDF features...")
+    vectorizer = TfidfVectorizer(stop_words=None, **params['tfidf'])
+    matrix = vectorizer.fit_transform(processed.iloc[rows])
+    print(f"TF-IDF matrix: {matrix.shape[0]} notes x {matrix.shape[1]} terms")
+
+    return {'tfidf_features': {'vectorizer': vectorizer, 'matrix': matrix, 'rows': rows}}
+
+
+def extract_features(pipeline, inputs, params):
+    """Sentiment scores, top terms and LDA topics of the preprocessed notes"""
+    from sklearn.decomposition import LatentDirichletAllocation
+
+    from lexicon_sentiment import LexiconSentiment, parity_report
+
+    features = inputs['tfidf_features']
+    df_cleaned = inputs['preprocessed'].iloc[features['rows']].reset_index(drop=True)
+    for column in ['processed_data', 'processed_conversation']:
+        df_cleaned[column] = _clean_text(df_cleaned[column])
+
+    # TextBlob polarity, scored for the whole corpus by sparse products
+    print("Performing sentiment analysis...")
+    sentiment = LexiconSentiment.from_textblob().fit(
+        pd.concat([df_cleaned['data'], df_cleaned['conversation']]))
+    df_cleaned['data_sentiment'] = sentiment.score(df_cleaned['data'])
+    df_cleaned['conversation_sentiment'] = sentiment.score(df_cleaned['conversation'])
+
+    sentiment_parity = {
+        column: parity_report(sentiment, df_cleaned[column], params['sentiment']['parity_sample'])
+        for column in ['data', 'conversation']
+    }
+    for column, report in sentiment_parity.items():
+        print(f"Sentiment parity vs TextBlob ({column}): mean abs error "
+              f"{report['mean_abs_error']:.4f}, sign agreement {report['sign_agreement']:.1%}")
+
+    # Top terms and topics come from the shared TF-IDF matrix
+    data_tfidf = features['matrix']
+    feature_names = features['vectorizer'].get_feature_names_out()
+    top_terms = pd.DataFrame({'term': feature_names,
+                              'weight': np.asarray(data_tfidf.sum(axis=0)).ravel()})
+    top_terms = top_terms.sort_values('weight', ascending=False, ignore_index=True)
+
+    print(f"\nPerforming topic modeling with {params['n_topics']} topics...")
+    lda = LatentDirichletAllocation(n_components=params['n_topics'], learning_method='online',
+                                    **params['lda'])
+    lda_output = lda.fit_transform(data_tfidf)
+    df_cleaned['dominant_topic'] = np.argmax(lda_output, axis=1)
+
+    return {
+        'enhanced': df_cleaned,
+        'top_terms': top_terms,
+        'topic_model': {'lda': lda, 'feature_names': feature_names},
+        'sentiment_parity': sentiment_parity
+    }
+
+
+def create_severity_labels(text):
+    """Create severity labels based on text content"""
+    return default_labeler.label(text)
+
+
+def label_severity(pipeline, inputs, params):
+    """Keyword severity label of every preprocessed note, in one vectorized pass per tier"""
+    labeler = SeverityLabeler(params['rules'])
+    df = inputs['enhanced']
+    df['severity'] = labeler.label_series(df['processed_data'])
+
+    print(f"\nClass distribution (severity rules v{labeler.version}):")
+    print(df['severity'].value_counts(normalize=True))
+    # The rule table travels with the exported model
+    return {'labeled': df, 'severity_rules': labeler.rules}
+
+
+def train(pipeline, inputs, params):
+    """Split the shared TF-IDF rows and fit the random forest"""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import LabelEncoder
+
+    features = inputs['tfidf_features']
+    tfidf = features['vectorizer']
+
+    # Encode labels; labeled rows follow the TF-IDF matrix rows
+    label_encoder = LabelEncoder()
+    y_encoded = label_encoder.fit_transform(inputs['labeled']['severity'])
+
+    # Split the data
+    train_rows, test_rows, y_train, y_test = train_test_split(
+        np.arange(len(y_encoded)), y_encoded, test_size=params['test_size'],
+        random_state=params['random_state'], stratify=y_encoded
+    )
+    X_train_tfidf = features['matrix'][train_rows]
+    X_test_tfidf = features['matrix'][test_rows]
+
+    print("\nTraining Random Forest model...")
+    model = RandomForestClassifier(n_jobs=-1, **params['forest'])
+    model.fit(X_train_tfidf, y_train)
+
+    feature_importance = pd.DataFrame({
+        'feature': tfidf.get_feature_names_out(),
+        'importance': model.feature_importances_
+    }).sort_values('importance', ascending=False)
+
+    return {
+        'trained': {
+            'model': model,
+            'tfidf': tfidf,
+            'label_encoder': label_encoder,
+            'X_test': X_test_tfidf,
+            'y_test': y_test,
+            'train_rows': train_rows,
+            'test_rows': test_rows
+        },
+        'feature_importance': feature_importance
+    }
+
+
+def evaluate(pipeline, inputs, params):
+    """Classification report and confusion matrix on the held-out split"""
+    from sklearn.metrics import classification_report, confusion_matrix
+
+    trained = inputs['trained']
+    y_pred = trained['model'].predict(trained['X_test'])
+    class_names = list(trained['label_encoder'].classes_)
+
+    report = classification_report(trained['y_test'], y_pred, target_names=class_names)
+    print("\nClassification Report:")
+    print(report)
+
+    return {
+        'evaluation': {
+            'report': report,
+            'metrics': classification_report(trained['y_test'], y_pred, target_names=class_names,
+                                             output_dict=True),
+            'confusion_matrix': confusion_matrix(trained['y_test'], y_pred),
+            'classes': class_names
+        }
+    }
+
+
+def train_fast_tier(pipeline, inputs, params):
+    """Fit the linear fast tier on the forest's training rows and measure the cascade"""
+    from sklearn.linear_model import LogisticRegression
+
+    from cascade import cascade_tradeoff
+
+    trained = inputs['trained']
+    matrix = inputs['tfidf_features']['matrix']
+    y_encoded = trained['label_encoder'].transform(inputs['labeled']['severity'])
+
+    print("\nTraining the linear fast tier...")
+    linear = LogisticRegression(**params['linear'])
+    linear.fit(matrix[trained['train_rows']], y_encoded[trained['train_rows']])
+
+    tradeoff = cascade_tradeoff(linear, trained['model'], trained['X_test'], trained['y_test'],
+                                params['thresholds'])
+    print("\nCascade trade-off on the held-out split:")
+    print(tradeoff.to_string(index=False))
+
+    return {
+        'fast_tier': {'linear_model': linear, 'margin_threshold': params['margin_threshold']},
+        'cascade_tradeoff': tradeoff
+    }
+
+
+def export(pipeline, inputs, params):
+    """Write the versioned single-file model bundle the classifier loads"""
+    from forest_engine import FlatForest
+    from model_bundle import BUNDLE_EXTENSION, write_bundle
+    from onnx_backend import export_onnx
+
+    trained = inputs['trained']
+    fast_tier = inputs['fast_tier']
+    feature_importance = inputs['feature_importance'].set_index('feature')
+    lemmas = inputs['lemma_table']
+    severity_rules = SeverityLabeler(inputs['severity_rules'])
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    version = f'medical_classifier_{timestamp}'
+    os.makedirs(pipeline.models_dir, exist_ok=True)
+    bundle_path = os.path.join(pipeline.models_dir, f'{version}{BUNDLE_EXTENSION}')
+
+    components = {
+        'model': trained['model'],
+        # Fast tier of the cascade, over the same TF-IDF features
+        'linear_model': fast_tier['linear_model'],
+        'tfidf_vectorizer': trained['tfidf'],
+        'label_encoder': trained['label_encoder'],
+        'feature_importance': feature_importance,
+        # Lemmas seen while normalizing the corpus, so serving normalizes
+        # notes identically without the WordNet corpus
+        'lemma_table': dict(zip(lemmas['token'], lemmas['lemma'])),
+        # The keyword rules that produced the training labels
+        'severity_rules': severity_rules.rules,
+        # Flat node arrays for the array-backed engine
+        'flat_forest': FlatForest.from_sklearn(trained['model'])
+    }
+    try:
+        # TF-IDF, forest and label decoding as one graph for the onnx engine
+        components['onnx_pipeline'] = export_onnx(trained['tfidf'], trained['model'],
+                                                  trained['label_encoder'])
+    except ImportError:
+        print("Skipping the ONNX export: skl2onnx is not installed")
+
+    manifest = write_bundle(bundle_path, components, {
+        'version': version,
+        'created_at': timestamp,
+        'model_type': type(trained['model']).__name__,
+        'classes': trained['label_encoder'].classes_.tolist(),
+        'n_features': len(feature_importance),
+        'severity_rules': {'version': severity_rules.version, 'fingerprint': severity_rules.fingerprint},
+        'cascade': {'margin_threshold': fast_tier['margin_threshold']}
+    })
+    print(f"Model bundle saved in: {bundle_path}")
+    return {'export': {'bundle_path': bundle_path, 'manifest': manifest}}
+
+
+# Shared by top terms, topic modeling and the classifier
+TFIDF_PARAMS = {
+    'tfidf': {'max_features': 1000, 'min_df': 5, 'max_df': 0.9}
+}
+
+# Sentiment and LDA settings of the feature stage
+FEATURE_PARAMS = {
+    # Lexicon scorer, checked against TextBlob on a sample of each column
+    'sentiment': {'parity_sample': 500},
+    'n_topics': 5,
+    'lda': {'max_iter': 20, 'learning_offset': 50.0, 'batch_size': 128, 'random_state': 42}
+}
+
+TRAIN_PARAMS = {
+    'test_size': 0.2,
+    'random_state': 42,
+    'forest': {'n_estimators': 100, 'max_depth': 20, 'min_samples_split': 5, 'random_state': 42}
+}
+
+# Linear fast tier; notes below margin_threshold fall back to the forest
+FAST_TIER_PARAMS = {
+    'linear': {'C': 10.0, 'max_iter': 1000},
+    'margin_threshold': 0.3,
+    'thresholds': [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.8, 1.0]
+}
+
+STAGES = [
+    Stage('preprocess', preprocess,
+          inputs={SOURCE: None},
+          outputs=['preprocessed', 'lemma_table'],
+          params={'stop_words': sorted(STOP_WORDS)},
+          helpers=['text_normalizer', 'parallel_preprocessing']),
+    Stage('featurize', featurize,
+          inputs={'preprocessed': ['processed_data']},
+          outputs=['tfidf_features'],
+          params=TFIDF_PARAMS),
+    Stage('features', extract_features,
+          inputs={'preprocessed': ['data', 'conversation', 'processed_data', 'processed_conversation'],
+                  'tfidf_features': None},
+          outputs=['enhanced', 'top_terms', 'topic_model', 'sentiment_parity'],
+          params=FEATURE_PARAMS,
+          helpers=['lexicon_sentiment']),
+    Stage('labels', label_severity,
+          inputs={'enhanced': ['processed_data']},
+          outputs=['labeled', 'severity_rules'],
+          params={'rules': DEFAULT_RULES},
+          helpers=['severity_labeler']),
+    Stage('train', train,
+          inputs={'labeled': ['severity'], 'tfidf_features': None},
+          outputs=['trained', 'feature_importance'],
+          params=TRAIN_PARAMS),
+    Stage('evaluate', evaluate,
+          inputs={'trained': None},
+          outputs=['evaluation']),
+    Stage('fast_tier', train_fast_tier,
+          inputs={'trained': None, 'tfidf_features': None, 'labeled': ['severity']},
+          outputs=['fast_tier', 'cascade_tradeoff'],
+          params=FAST_TIER_PARAMS,
+          helpers=['cascade']),
+    Stage('export', export,
+          inputs={'trained': None, 'fast_tier': None, 'feature_importance': None, 'lemma_table': None,
+                  'severity_rules': None},
+          outputs=['export'],
+          helpers=['severity_labeler', 'forest_engine', 'onnx_backend', 'model_bundle'])
+]
+
+
+class TrainingPipeline:
+    def __init__(self, source_path, store=None, stages=STAGES, models_dir=MODELS_DIR, n_workers=None):
+        """Stages over the source CSV, with outputs kept in an ArtifactStore
+
+        n_workers sets the preprocessing pool size; like models_dir it
+        does not change any stage output, so it is not part of the keys.
+        """
+        self.source_path = source_path
+        self.store = store or ArtifactStore()
+        self.stages = {stage.name: stage for stage in stages}
+        self.producers = {output: stage for stage in stages for output in stage.outputs}
+        self.models_dir = models_dir
+        self.n_workers = n_workers
+        self._keys = {}
+
+    def key(self, name):
+        """Content key of a stage from its input keys, parameters and code"""
+        if name not in self._keys:
+            stage = self.stages[name]
+            input_keys = [self._artifact_key(artifact) for artifact in stage.inputs]
+            self._keys[name] = content_hash(input_keys, {'params': stage.params,
+                                                         'code': stage.code_digest()})
+        return self._keys[name]
+
+    def _artifact_key(self, artifact):
+        if artifact == SOURCE:
+            return file_digest(self.source_path)
+        return f'{artifact}-{self.key(self.producers[artifact].name)}'
+
+    def refresh(self):
+        """Forget the computed keys, so edited parameters, code or source data are picked up"""
+        self._keys = {}
+
+    def is_current(self, name):
+        """Whether every output of the stage exists under its current key"""
+        self.refresh()
+        return self._is_current(name)
+
+    def _is_current(self, name):
+        key = self.key(name)
+        return all(self.store.exists(output, key) for output in self.stages[name].outputs)
+
+    def upstream(self, name):
+        """The stage and everything it depends on, in run order"""
+        order = []
+
+        def visit(stage_name):
+            for artifact in self.stages[stage_name].inputs:
+                if artifact != SOURCE:
+                    visit(self.producers[artifact].name)
+            if stage_name not in order:
+                order.append(stage_name)
+
+        visit(name)
+        return order
+
+    def load(self, artifact, columns=None):
+        """Load a stage output, optionally only some columns of a table"""
+        if artifact == SOURCE:
+            return pd.read_csv(self.source_path, usecols=columns)
+        key = self.key(self.producers[artifact].name)
+        if self.store.is_table(artifact, key):
+            return self.store.load(artifact, key, columns)
+        return self.store.load_object(artifact, key)
+
+    def run(self, target=None, force=False):
+        """Bring a stage (default: all stages) up to date, rerunning only stale ones
+
+        force reruns the target stage even when its outputs are current.
+        Returns the status of every stage considered: 'ran' or 'cached'.
+        Keys are recomputed on every call, so a long-lived pipeline picks
+        up edited parameters and a changed source file.
+        """
+        self.refresh()
+        targets = [target] if target else list(self.stages)
+        order = []
+        for name in targets:
+            order.extend(stage for stage in self.upstream(name) if stage not in order)
+
+        statuses = {}
+        for name in order:
+            if self._is_current(name) and not (force and name in targets):
+                print(f"[{name}] up to date ({self.key(name)})")
+                statuses[name] = 'cached'
+                continue
+
+            print(f"[{name}] running ({self.key(name)})")
+            stage = self.stages[name]
+            inputs = {artifact: self.load(artifact, columns) for artifact, columns in stage.inputs.items()}
+            outputs = stage.fn(self, inputs, stage.params)
+
+            key = self.key(name)
+            for output in stage.outputs:
+                value = outputs[output]
+                if isinstance(value, pd.DataFrame):
+                    self.store.save(output, key, value)
+                else:
+                    self.store.save_object(output, key, value)
+            statuses[name] = 'ran'
+        return statuses
+
+    def status(self):
+        self.refresh()
+        return {name: 'current' if self._is_current(name) else 'stale' for name in self.stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the training pipeline, skipping up-to-date stages")
+    parser.add_argument('source', help="Source CSV with data and conversation columns")
+    parser.add_argument('--stage', choices=[stage.name for stage in STAGES],
+                        help="Run only this stage and the stages it depends on")
+    parser.add_argument('--force', action='store_true', help="Rerun the target stage even if it is current")
+    parser.add_argument('--status', action='store_true', help="Show which stages are current and exit")
+    parser.add_argument('--artifacts', default='artifacts', help="Stage artifact directory")
+    parser.add_argument('--models-dir', default=MODELS_DIR)
+    parser.add_argument('--workers', type=int, help="Preprocessing processes (default: all cores)")
+    args = parser.parse_args()
+
+    pipeline = TrainingPipeline(args.source, ArtifactStore(args.artifacts),
+                                models_dir=args.models_dir, n_workers=args.workers)
+    if args.status:
+        for name, status in pipeline.status().items():
+            print(f"{name:<12} {status}")
+        return
+
+    statuses = pipeline.run(args.stage, force=args.force)
+    print("\nPipeline summary:")
+    for name, status in statuses.items():
+        print(f"- {name}: {status}")
+
+    if 'export' in statuses:
+        print(f"\nModel bundle: {pipeline.load('export')['bundle_path']}")
+
+
+if __name__ == "__main__":
+    main()